@@ -0,0 +1,270 @@
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional
+import asyncio
+import logging
+import re
+import time
+
+from fastapi import status
+from fastapi.responses import HTMLResponse
+
+from metrics import ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT
+import config
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PATH = re.compile('/submit/([^/]+)')
+
+
+class Waiter(NamedTuple):
+    """
+    The class defines an upload waiting to be admitted.
+    """
+    mission_url: str
+    size: int
+    future: asyncio.Future
+
+
+class AdmissionController:
+    """
+    The controller limiting the uploads received at the same time by a worker.
+    Uploads are admitted while under the global cap, the cap of their mission
+    and the byte budget; others wait in a bounded queue, in arrival order.
+    A cap of 0 means no limit.
+    """
+    running: int
+    running_bytes: int
+    running_missions: Dict[str, int]
+    waiters: Deque[Waiter]
+
+    def __init__(self, max_uploads: int, max_mission_uploads: int,
+                 max_bytes: int, max_queue: int):
+        """
+        Initialize the AdmissionController.
+
+        Args:
+            self: the instance
+            max_uploads: uploads received at the same time
+            max_mission_uploads: uploads of a mission received at the same time
+            max_bytes: bytes of the uploads received at the same time
+            max_queue: uploads waiting to be admitted
+
+        Returns:
+            AdmissionController
+        """
+        self.max_uploads = max_uploads
+        self.max_mission_uploads = max_mission_uploads
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.running = 0
+        self.running_bytes = 0
+        self.running_missions = {}
+        self.waiters = deque()
+
+    def fits_globally(self, size: int) -> bool:
+        """
+        Check if an upload fits the global cap and the byte budget.
+        An upload larger than the whole budget is admitted alone.
+
+        Args:
+            self: the instance
+            size: size of the upload
+
+        Returns:
+            bool: if the upload fits
+        """
+        if self.max_uploads and self.running >= self.max_uploads:
+            return False
+        if self.max_bytes and self.running_bytes and \
+                self.running_bytes + size > self.max_bytes:
+            return False
+        return True
+
+    def fits_mission(self, mission_url: str) -> bool:
+        """
+        Check if an upload fits the cap of its mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            bool: if the upload fits
+        """
+        return not self.max_mission_uploads or \
+            self.running_missions.get(mission_url, 0) < self.max_mission_uploads
+
+    def admit(self, mission_url: str, size: int) -> None:
+        """
+        Count an upload as running.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            size: size of the upload
+
+        Returns:
+            None
+        """
+        self.running += 1
+        self.running_bytes += size
+        self.running_missions[mission_url] = self.running_missions.get(mission_url, 0) + 1
+
+    async def acquire(self, mission_url: str, size: int) -> Optional[str]:
+        """
+        Wait until an upload is admitted.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            size: size of the upload
+
+        Returns:
+            Optional[str]: None if admitted, else why it is rejected
+        """
+        if not self.waiters and self.fits_globally(size) and self.fits_mission(mission_url):
+            self.admit(mission_url, size)
+            return None
+        if len(self.waiters) >= self.max_queue:
+            return 'queue_full'
+
+        waiter = Waiter(mission_url, size, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        # the waiters ahead may only be blocked by the caps of their missions
+        self.dispatch()
+        if waiter.future.done():
+            return None
+        ADMISSION_QUEUED.inc()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), config.ADMISSION_TIMEOUT)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # admitted just as the timeout expired
+                return None
+            self.waiters.remove(waiter)
+            return 'timeout'
+        except asyncio.CancelledError:
+            # the client went away while waiting
+            if waiter.future.done():
+                self.release(mission_url, size)
+            else:
+                self.waiters.remove(waiter)
+            raise
+        finally:
+            ADMISSION_QUEUED.dec()
+            ADMISSION_WAIT.observe(time.perf_counter() - start)
+        return None
+
+    def release(self, mission_url: str, size: int) -> None:
+        """
+        Count an upload as finished, and admit the waiting ones which fit.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            size: size of the upload
+
+        Returns:
+            None
+        """
+        self.running -= 1
+        self.running_bytes -= size
+        self.running_missions[mission_url] -= 1
+        if not self.running_missions[mission_url]:
+            del self.running_missions[mission_url]
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """
+        Admit the waiting uploads which fit.
+        Waiters are admitted in arrival order; one blocked only by the cap
+        of its mission is skipped, so a busy mission does not hold up others.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        skipped = []
+        while self.waiters:
+            waiter = self.waiters[0]
+            if not self.fits_globally(waiter.size):
+                break
+            self.waiters.popleft()
+            if not self.fits_mission(waiter.mission_url):
+                skipped.append(waiter)
+                continue
+            self.admit(waiter.mission_url, waiter.size)
+            waiter.future.set_result(None)
+        self.waiters.extendleft(reversed(skipped))
+
+
+class AdmissionMiddleware:
+    """
+    The ASGI middleware admitting submissions before their bodies are parsed.
+    Rejected ones get a 503 with Retry-After at once.
+    """
+
+    def __init__(self, app):
+        """
+        Initialize the AdmissionMiddleware.
+
+        Args:
+            self: the instance
+            app: the ASGI app
+
+        Returns:
+            AdmissionMiddleware
+        """
+        self.app = app
+        self.controller = AdmissionController(config.ADMISSION_MAX_UPLOADS,
+                                              config.ADMISSION_MAX_MISSION_UPLOADS,
+                                              config.ADMISSION_MAX_BYTES,
+                                              config.ADMISSION_QUEUE)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            await self.app(scope, receive, send)
+            return
+        matched = UPLOAD_PATH.fullmatch(scope['path'])
+        if not matched:
+            await self.app(scope, receive, send)
+            return
+
+        mission_url = matched.group(1)
+        size = self.content_length(scope)
+        rejected = await self.controller.acquire(mission_url, size)
+        if rejected:
+            ADMISSION_REJECTED.inc(rejected)
+            logger.warning('upload rejected: %s %s', mission_url, rejected)
+            response = HTMLResponse('<h2>提交的人太多了，请稍后再试。</h2>',
+                                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    headers={'Retry-After': str(config.ADMISSION_RETRY_AFTER)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(mission_url, size)
+
+    def content_length(self, scope) -> int:
+        """
+        Get the size of a request body from its Content-Length.
+        A body of unknown size is counted as an even share of the byte budget.
+
+        Args:
+            self: the instance
+            scope: the ASGI scope
+
+        Returns:
+            int: the size
+        """
+        for name, value in scope['headers']:
+            if name == b'content-length':
+                try:
+                    return int(value)
+                except ValueError:
+                    break
+        return config.ADMISSION_MAX_BYTES // max(config.ADMISSION_MAX_UPLOADS, 1)
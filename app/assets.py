@@ -0,0 +1,292 @@
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+import uuid
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_SUFFIXES = ['.css', '.js', '.map', '.svg', '.ico', '.txt', '.html', '.json']
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+mimetypes.add_type('application/json', '.map')
+
+
+class Asset(NamedTuple):
+    """
+    The class defines a static file, with its fingerprinted name and
+    precompressed variants.
+    """
+    url: str
+    path: Path
+    media_type: str
+    variants: Dict[str, Path]
+
+
+def fingerprint(name: str, digest: str) -> str:
+    """
+    Insert a content hash into a file name, before its suffixes.
+
+    Args:
+        name: the file name
+        digest: hash of the content
+
+    Returns:
+        str: the fingerprinted name
+    """
+    stem, dot, suffixes = name.partition('.')
+    return f'{stem}.{digest[:12]}{dot}{suffixes}'
+
+
+def write_atomic(target: Path, content: bytes) -> None:
+    """
+    Write a file so that readers never see it half written.
+
+    Args:
+        target: path of the file
+        content: content of the file
+
+    Returns:
+        None
+    """
+    temp_path = target.parent / f'.{uuid.uuid4().hex}.part'
+    temp_path.write_bytes(content)
+    os.replace(temp_path, target)
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    """
+    Compress content with the best ratio of an encoding.
+
+    Args:
+        content: the content
+        encoding: 'gzip' or 'br'
+
+    Returns:
+        bytes: the compressed content
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=11)
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """
+    Parse the Accept-Encoding header.
+
+    Args:
+        accept_encoding: the header
+
+    Returns:
+        Dict[str, float]: quality of each coding
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = quality
+    return qualities
+
+
+class StaticAssets:
+    """
+    The fingerprinted and precompressed static files.
+    Compressed variants are stored by content hash under the build directory,
+    so they are built once, at image build or at the first start; variants
+    not saving enough are marked by an empty file ending with .skip.
+    """
+    directory: Path
+    build_path: Path
+    assets: Dict[str, Asset]
+    urls: Dict[str, Asset]
+    version: str
+
+    def __init__(self, directory: Path, build_path: Path):
+        """
+        Initialize the StaticAssets.
+
+        Args:
+            self: the instance
+            directory: directory of the static files
+            build_path: directory of the compressed variants
+
+        Returns:
+            StaticAssets
+        """
+        self.directory = directory
+        self.build_path = build_path
+        self.assets = {}
+        self.urls = {}
+        self.version = ''
+
+    def build(self) -> None:
+        """
+        Fingerprint every static file and precompress the compressible ones.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        start = time.perf_counter()
+        encodings = ['gzip', 'br'] if brotli else ['gzip']
+        assets = {}
+        versions = hashlib.sha256()
+        for path in sorted(self.directory.rglob('*')):
+            if not path.is_file():
+                continue
+            name = path.relative_to(self.directory).as_posix()
+            content = path.read_bytes()
+            digest = hashlib.sha256(content).hexdigest()
+            versions.update(f'{name}:{digest}\n'.encode('UTF-8'))
+            url = str(Path(name).with_name(fingerprint(path.name, digest)).as_posix())
+            variants = {}
+            if path.suffix in COMPRESSIBLE_SUFFIXES and len(content) >= 1024:
+                for encoding in encodings:
+                    suffix = '.br' if encoding == 'br' else '.gz'
+                    variant = self.build_path / f'{digest}{suffix}'
+                    skipped = self.build_path / f'{digest}{suffix}.skip'
+                    if skipped.exists():
+                        continue
+                    if not variant.exists():
+                        compressed = compress(content, encoding)
+                        self.build_path.mkdir(parents=True, exist_ok=True)
+                        if len(compressed) > 0.9 * len(content):
+                            # not worth it, remembered so it is not compressed again
+                            write_atomic(skipped, b'')
+                            continue
+                        write_atomic(variant, compressed)
+                    variants[encoding] = variant
+            media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            assets[name] = Asset(url, path, media_type, variants)
+        self.assets = assets
+        self.urls = {asset.url: asset for asset in assets.values()}
+        self.version = versions.hexdigest()
+        logger.info('BUILD_ASSETS %d files, %.1fms, %s', len(assets),
+                    1000 * (time.perf_counter() - start), encodings)
+
+    def url(self, name: str) -> str:
+        """
+        Get the fingerprinted url of a static file, used by templates.
+
+        Args:
+            self: the instance
+            name: name of the file under the static directory
+
+        Returns:
+            str: the url
+        """
+        asset = self.assets.get(name)
+        if asset is None:
+            logger.warning('static file not found: %s', name)
+            return f'/static/{name}'
+        return f'/static/{asset.url}'
+
+
+class AssetFiles(StaticFiles):
+    """
+    The static files app serving precompressed variants by Accept-Encoding.
+    Fingerprinted urls are cached forever; plain names are still served,
+    to be revalidated.
+    """
+
+    def __init__(self, assets: StaticAssets, **kwargs):
+        """
+        Initialize the AssetFiles.
+
+        Args:
+            self: the instance
+            assets: the static assets
+
+        Returns:
+            AssetFiles
+        """
+        super().__init__(directory=assets.directory, **kwargs)
+        self.static_assets = assets
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """
+        Get the response of a static file.
+
+        Args:
+            self: the instance
+            path: path of the file under the static directory
+            scope: the ASGI scope
+
+        Returns:
+            Response: the response
+        """
+        name = Path(path).as_posix()
+        asset = self.static_assets.urls.get(name)
+        immutable = asset is not None
+        if asset is None:
+            asset = self.static_assets.assets.get(name)
+        if asset is None or scope['method'] not in ['GET', 'HEAD']:
+            return await super().get_response(path, scope)
+
+        headers = {'Cache-Control': IMMUTABLE if immutable else 'no-cache'}
+        file_path = asset.path
+        if asset.variants:
+            headers['Vary'] = 'Accept-Encoding'
+            encoding = self.negotiate(scope, asset)
+            if encoding:
+                headers['Content-Encoding'] = encoding
+                file_path = asset.variants[encoding]
+        response = FileResponse(file_path, headers=headers, media_type=asset.media_type,
+                                stat_result=os.stat(file_path), method=scope['method'])
+        if not immutable and self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    @staticmethod
+    def negotiate(scope: Scope, asset: Asset) -> Optional[str]:
+        """
+        Pick the best precompressed variant accepted by the client.
+
+        Args:
+            scope: the ASGI scope
+            asset: the static file
+
+        Returns:
+            Optional[str]: the encoding, None for the file itself
+        """
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        qualities = accepted_encodings(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in ['br', 'gzip']:
+            quality = qualities.get(encoding, qualities.get('*', 0.0))
+            if encoding in asset.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+
+static_assets = StaticAssets(config.static_path, config.static_build_path)
+
+if __name__ == '__main__':
+    # run at image build, so workers start with the variants in place
+    static_assets.build()
@@ -0,0 +1,447 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from metrics import CHECKER_LATENCY
+from store import Submission
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedChecker(NamedTuple):
+    """
+    The class defines a checker loaded from local storage.
+    """
+    mtime_ns: int
+    size: int
+    source_hash: str
+    main: Callable
+
+
+loaded_checkers: Dict[str, LoadedChecker] = {}
+load_times: Dict[str, float] = {}
+load_lock = threading.Lock()
+
+
+def load_checker(checker_path: Path) -> Callable:
+    """
+    Get the main function of a checker, loading it if needed.
+    The checker is loaded again, into a fresh module, when its source
+    has changed, and its previous module is left untouched.
+
+    Args:
+        checker_path: path of the checker
+
+    Returns:
+        Callable: the main function
+    """
+    stat = checker_path.stat()
+    loaded = loaded_checkers.get(str(checker_path))
+    if loaded and (loaded.mtime_ns, loaded.size) == (stat.st_mtime_ns, stat.st_size):
+        return loaded.main
+
+    with load_lock:
+        source = checker_path.read_bytes()
+        source_hash = hashlib.sha256(source).hexdigest()
+        if loaded and loaded.source_hash == source_hash:
+            main = loaded.main
+        else:
+            start = time.perf_counter()
+            name = f'{config.import_root}{checker_path.stem}'
+            module = types.ModuleType(name)
+            module.__file__ = str(checker_path)
+            previous = sys.modules.get(name)
+            # classes defined in the checker look up their module while created
+            sys.modules[name] = module
+            try:
+                exec(compile(source, checker_path, 'exec'),  # pylint: disable=exec-used
+                     module.__dict__)
+            finally:
+                if previous is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = previous
+            main = module.main
+            load_times[checker_path.stem] = time.perf_counter() - start
+            logger.info('LOAD_CHECKER %s %.1fms', checker_path.stem,
+                        1000 * load_times[checker_path.stem])
+        loaded_checkers[str(checker_path)] = LoadedChecker(
+            stat.st_mtime_ns, stat.st_size, source_hash, main)
+    return main
+
+
+def run_checker(checker_path: Path, file_path: Path) -> str:
+    """
+    Run a checker against a submitted file.
+    Runs in the executor, so a process pool keeps its own loaded checkers.
+    The main function of a checker returns its HTML output either as a str
+    or as an iterable of str chunks, which are joined here.
+
+    Args:
+        checker_path: path of the checker
+        file_path: path of the submitted file
+
+    Returns:
+        str: HTML output
+    """
+    result = load_checker(checker_path)(file_path)
+    if isinstance(result, str):
+        return result
+    return ''.join(result)
+
+
+def preload_checkers(checker_paths: Dict[str, Path]) -> None:
+    """
+    Load all checkers and log how long each one took.
+
+    Args:
+        checker_paths: paths of the checkers, keyed by mission url
+
+    Returns:
+        None
+    """
+    for mission_url in sorted(checker_paths):
+        try:
+            load_checker(checker_paths[mission_url])
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('checker invalid: %s %s', mission_url, exception)
+    report = ', '.join(f'{key}: {1000 * value:.1f}ms'
+                       for key, value in sorted(load_times.items()))
+    logger.info('CHECKER_LOAD_TIMES %s', report)
+
+
+def create_executor() -> Executor:
+    """
+    Create the executor for checkers according to config.
+
+    Args:
+        None
+
+    Returns:
+        Executor: the executor
+    """
+    if config.CHECKER_EXECUTOR == 'process':
+        return ProcessPoolExecutor(max_workers=config.CHECKER_WORKERS)
+    return ThreadPoolExecutor(max_workers=config.CHECKER_WORKERS,
+                              thread_name_prefix='checker')
+
+
+class CheckerCache:
+    """
+    The cache of checker results, in memory and on local storage.
+    """
+    path: Path
+    capacity: int
+    memory: 'OrderedDict[str, str]'
+
+    def __init__(self, path: Path, capacity: int):
+        """
+        Initialize the CheckerCache.
+
+        Args:
+            self: the instance
+            path: directory of the cache on local storage
+            capacity: count of results kept in memory
+
+        Returns:
+            CheckerCache
+        """
+        self.path = path
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(mission_url: str, submission: Submission, checker_hash: str) -> str:
+        """
+        Make the cache key of a submitted file.
+        The key changes when the file is re-uploaded or locked,
+        or when the checker is changed.
+
+        Args:
+            mission_url: the url-name of the mission
+            submission: the submitted file
+            checker_hash: hash of the checker source
+
+        Returns:
+            str: the key
+        """
+        identity = [mission_url, str(submission.path), int(submission.size),
+                    submission.mtime_ns, checker_hash]
+        return hashlib.sha256(json.dumps(identity).encode('UTF-8')).hexdigest()
+
+    def file_path(self, key: str) -> Path:
+        """
+        Get the path of a cached result on local storage.
+
+        Args:
+            self: the instance
+            key: the cache key
+
+        Returns:
+            Path: path of the result
+        """
+        return self.path / key[:2] / f'{key}.html'
+
+    def get_memory(self, key: str) -> Optional[str]:
+        """
+        Get a result from memory.
+
+        Args:
+            self: the instance
+            key: the cache key
+
+        Returns:
+            Optional[str]: the result
+        """
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+            return result
+
+    def set_memory(self, key: str, result: str) -> None:
+        """
+        Put a result into memory, evicting the least recently used ones.
+
+        Args:
+            self: the instance
+            key: the cache key
+            result: the result
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.capacity:
+                self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a result, from memory or else from local storage.
+
+        Args:
+            self: the instance
+            key: the cache key
+
+        Returns:
+            Optional[str]: the result
+        """
+        result = self.get_memory(key)
+        if result is not None:
+            return result
+        try:
+            result = self.file_path(key).read_text(encoding='UTF-8')
+        except FileNotFoundError:
+            return None
+        self.set_memory(key, result)
+        return result
+
+    def set(self, key: str, result: str) -> None:
+        """
+        Put a result into memory and local storage.
+
+        Args:
+            self: the instance
+            key: the cache key
+            result: the result
+
+        Returns:
+            None
+        """
+        self.set_memory(key, result)
+        file_path = self.file_path(key)
+        temp_path = file_path.parent / f'.{uuid.uuid4().hex}.part'
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_text(result, encoding='UTF-8')
+            os.replace(temp_path, file_path)
+        except OSError as exception:
+            logger.warning('cache write failed: %s', exception)
+            temp_path.unlink(missing_ok=True)
+
+
+class CheckerPool:
+    """
+    The pool running mission checkers off the event loop.
+    """
+    executor: Executor
+    cache: CheckerCache
+    running: Dict[str, asyncio.Future]
+    slots: asyncio.Semaphore
+
+    def __init__(self):
+        """
+        Initialize the CheckerPool.
+
+        Args:
+            self: the instance
+
+        Returns:
+            CheckerPool
+        """
+        self.executor = create_executor()
+        self.cache = CheckerCache(config.cache_path, config.CHECKER_CACHE_SIZE)
+        self.running = {}
+        self.slots = asyncio.Semaphore(config.CHECKER_WORKERS)
+
+    async def cached(self, mission_url: str, checker_hash: str,
+                     submission: Submission) -> Optional[str]:
+        """
+        Get the checker result of a submitted file if it is finished.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            checker_hash: hash of the checker source
+            submission: the submitted file
+
+        Returns:
+            Optional[str]: HTML output, None if the checker is not finished
+        """
+        key = CheckerCache.make_key(mission_url, submission, checker_hash)
+        result = self.cache.get_memory(key)
+        if result is None:
+            result = await run_in_threadpool(self.cache.get, key)
+        return result
+
+    async def check(self, key: str, mission_url: str,
+                    checker_path: Path, file_path: Path) -> str:
+        """
+        Get the checker result of a submitted file, running the checker
+        in the pool on a cache miss. The same file is only checked once
+        at a time.
+
+        Args:
+            self: the instance
+            key: the cache key
+            mission_url: the url-name of the mission
+            checker_path: path of the checker
+            file_path: path of the submitted file
+
+        Returns:
+            str: HTML output
+        """
+        future = self.running.get(key)
+        if future is None:
+            result = await run_in_threadpool(self.cache.get, key)
+            if result is not None:
+                return result
+            future = asyncio.ensure_future(
+                self.__check(key, mission_url, checker_path, file_path))
+            self.running[key] = future
+            future.add_done_callback(lambda _: self.running.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def __check(self, key: str, mission_url: str,
+                      checker_path: Path, file_path: Path) -> str:
+        """
+        Run a checker in the executor and cache its result.
+
+        Args:
+            self: the instance
+            key: the cache key
+            mission_url: the url-name of the mission
+            checker_path: path of the checker
+            file_path: path of the submitted file
+
+        Returns:
+            str: HTML output
+        """
+        loop = asyncio.get_running_loop()
+        # a slot is held until the checker is really finished, even after a timeout
+        await self.slots.acquire()
+        executor = self.executor
+        try:
+            future = executor.submit(run_checker, checker_path, file_path)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.release_slot(loop))
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), config.CHECKER_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning('checker timed out: %s %s', mission_url, file_path)
+            if isinstance(executor, ProcessPoolExecutor):
+                self.replace_executor(executor)
+            result = f'<h2>出现问题: 检查超过 {config.CHECKER_TIMEOUT:g} 秒</h2>'
+        except BrokenExecutor as exception:
+            # stopped with a checker which timed out, not cached to be checked again
+            logger.warning('checker stopped: %s %s', mission_url, exception)
+            return f'<h2>出现问题: {exception}</h2>'
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.exception('checker failed: %s', exception)
+            result = f'<h2>出现问题: {exception}</h2>'
+        finally:
+            CHECKER_LATENCY.observe(time.perf_counter() - start, mission_url)
+        # failures are cached as well, the same file and checker fail the same way
+        await run_in_threadpool(self.cache.set, key, result)
+        return result
+
+    def release_slot(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Release the slot of a finished checker, from the thread finishing it.
+
+        Args:
+            self: the instance
+            loop: the event loop of the pool
+
+        Returns:
+            None
+        """
+        try:
+            loop.call_soon_threadsafe(self.slots.release)
+        except RuntimeError:
+            # the loop is closed at shutdown
+            pass
+
+    def replace_executor(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Replace a process pool running a checker which timed out,
+        terminating its processes so that their slots are freed.
+        The other checkers it was running fail, and are not cached.
+
+        Args:
+            self: the instance
+            executor: the executor running the checker
+
+        Returns:
+            None
+        """
+        if self.executor is not executor:
+            return
+        self.executor = create_executor()
+        processes = list((executor._processes or {}).values())  # pylint: disable=protected-access
+        executor.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    def shutdown(self) -> None:
+        """
+        Shutdown the executor.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        self.executor.shutdown(wait=False)
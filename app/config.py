@@ -1,15 +1,94 @@
 from pathlib import Path
 import logging
 import os
+import tempfile
 
 ROOT_PATH: Path = Path.cwd()
 DP_SUBPATH: str = 'db'
 RECEIVED_SUBPATH: str = 'received'
 STUDENTS_SUBPATH: str = 'students.json'
 MISSION_SUBPATH: str = 'missions'
+CACHE_SUBPATH: str = 'cache'
+JOBS_SUBPATH: str = 'jobs'
+UPLOADS_SUBPATH: str = '.uploads'
+STATIC_SUBPATH: str = 'static'
+STATIC_BUILD_SUBPATH: str = '.static'
+SNAPSHOT_SUBPATH: str = 'store.pickle'
+JOURNAL_SUBPATH: str = 'journal'
+HASH_XATTR: str = 'user.sha256'
 
 DATETIME_FORMAT: str = '%a %Y-%m-%d %H:%M:%S'
 
+# Size of each chunk read from an upload, in bytes
+UPLOAD_CHUNK_SIZE: int = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+# Seconds an unfinished resumable upload is kept
+UPLOAD_SESSION_TTL: int = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+
+# Checkers run in a 'thread' or 'process' pool
+CHECKER_EXECUTOR: str = os.getenv('CHECKER_EXECUTOR', 'process')
+# Count of checkers running at the same time
+CHECKER_WORKERS: int = int(os.getenv('CHECKER_WORKERS', str(os.cpu_count() or 1)))
+# Seconds between polls of the job queue for jobs queued by other workers
+JOB_POLL_INTERVAL: float = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+# Count of rendered pages and fragments kept in memory
+FRAGMENT_CACHE_SIZE: int = int(os.getenv('FRAGMENT_CACHE_SIZE', '4096'))
+
+# Load every checker at startup instead of on first use, and report load times
+CHECKER_PRELOAD: bool = os.getenv('CHECKER_PRELOAD') == '1'
+# Seconds a checker may run on one file before its job fails and its slot is freed
+CHECKER_TIMEOUT: float = float(os.getenv('CHECKER_TIMEOUT', '60'))
+# Count of checker results kept in memory
+CHECKER_CACHE_SIZE: int = int(os.getenv('CHECKER_CACHE_SIZE', '256'))
+
+# Seconds to wait for more changes before reloading students, missions and checkers
+RELOAD_DEBOUNCE: float = float(os.getenv('RELOAD_DEBOUNCE', '0.5'))
+
+# Token required by admin endpoints, which are disabled when empty
+ADMIN_TOKEN: str = os.getenv('ADMIN_TOKEN', '')
+
+# Keep a snapshot of parsed data, validated by file times and sizes, to start faster
+STORE_SNAPSHOT: bool = os.getenv('STORE_SNAPSHOT', '1') == '1'
+# Append uploads and locks to a journal of each mission, replayed at startup instead of scanning
+SUBMISSION_JOURNAL: bool = os.getenv('SUBMISSION_JOURNAL', '1') == '1'
+# Seconds between fsyncs of the journals, records appended since may be lost on a power failure
+JOURNAL_FSYNC_INTERVAL: float = float(os.getenv('JOURNAL_FSYNC_INTERVAL', '1'))
+# Uploads and locks appended to the journal of a mission before it is compacted
+JOURNAL_COMPACT_RECORDS: int = int(os.getenv('JOURNAL_COMPACT_RECORDS', '1000'))
+
+# Share one store between gunicorn workers, needs gunicorn preload_app
+SHARED_STATE: bool = os.getenv('SHARED_STATE') == '1'
+# Count of buckets notifying workers of changed mission directories
+SHARED_BUCKETS: int = int(os.getenv('SHARED_BUCKETS', '64'))
+# Count of changed received files remembered for workers, beyond which they rescan buckets
+SHARED_CHANGES: int = int(os.getenv('SHARED_CHANGES', '1024'))
+
+# Uploads each worker receives at the same time, 0 for no limit
+ADMISSION_MAX_UPLOADS: int = int(os.getenv('ADMISSION_MAX_UPLOADS', '32'))
+# Uploads of one mission each worker receives at the same time, 0 for no limit
+ADMISSION_MAX_MISSION_UPLOADS: int = int(os.getenv('ADMISSION_MAX_MISSION_UPLOADS', '16'))
+# Bytes of the uploads each worker receives at the same time, 0 for no limit
+ADMISSION_MAX_BYTES: int = int(os.getenv('ADMISSION_MAX_BYTES', str(1024 * 1024 * 1024)))
+# Uploads waiting to be admitted, more are rejected at once
+ADMISSION_QUEUE: int = int(os.getenv('ADMISSION_QUEUE', '64'))
+# Seconds an upload waits to be admitted before it is rejected
+ADMISSION_TIMEOUT: float = float(os.getenv('ADMISSION_TIMEOUT', '10'))
+# Seconds told to rejected clients to wait before retrying
+ADMISSION_RETRY_AFTER: int = int(os.getenv('ADMISSION_RETRY_AFTER', '5'))
+
+# Storage of received files, 'local' or 's3' (needs boto3)
+STORAGE_BACKEND: str = os.getenv('STORAGE_BACKEND', 'local')
+# Bucket, key prefix and endpoint of the s3 storage, credentials are read by boto3
+S3_BUCKET: str = os.getenv('S3_BUCKET', 'collector')
+S3_PREFIX: str = os.getenv('S3_PREFIX', '')
+S3_ENDPOINT_URL: str = os.getenv('S3_ENDPOINT_URL', '')
+# Seconds between rescans of the s3 storage for files saved by other nodes
+STORAGE_RESCAN_INTERVAL: float = float(os.getenv('STORAGE_RESCAN_INTERVAL', '10'))
+# Seconds the download links to files in the s3 storage are valid for
+S3_LINK_EXPIRES: int = int(os.getenv('S3_LINK_EXPIRES', '300'))
+
+# Seconds between each worker writing its metrics for /metrics to aggregate
+METRICS_INTERVAL: float = float(os.getenv('METRICS_INTERVAL', '5'))
+
 # Below are auto-computed
 # You should not change
 
@@ -21,11 +100,24 @@ logging.basicConfig(level=LOG_LEVEL)
 
 db_path: Path = ROOT_PATH / DP_SUBPATH
 received_path: Path = ROOT_PATH / RECEIVED_SUBPATH
+uploads_path: Path = received_path / UPLOADS_SUBPATH
 students_path: Path = db_path / STUDENTS_SUBPATH
 missions_path: Path = db_path / MISSION_SUBPATH
+cache_path: Path = db_path / CACHE_SUBPATH
+jobs_path: Path = db_path / JOBS_SUBPATH
+snapshot_path: Path = cache_path / SNAPSHOT_SUBPATH
+journal_path: Path = db_path / JOURNAL_SUBPATH
+static_path: Path = ROOT_PATH / STATIC_SUBPATH
+static_build_path: Path = ROOT_PATH / STATIC_BUILD_SUBPATH
 
 import_root: str = f'{DP_SUBPATH}.{MISSION_SUBPATH}.'
 
+shared_path: Path = Path('/dev/shm')
+if not shared_path.is_dir():
+    shared_path = Path(tempfile.gettempdir())
+# workers of one server share the process group of their master
+metrics_path: Path = shared_path / f'collector-metrics-{os.getpgrp()}'
+
 
 def get_file_name(stu, ext: str, confirmed: bool = True) -> str:
     """
@@ -1,21 +1,14 @@
+import html
+import os
 import zipfile
+from collections.abc import Iterator
 from pathlib import Path
-from datetime import datetime
-from pydantic import BaseModel, ByteSize
 
+# Entries listed at most, the rest are summed up in one row
+LIST_LIMIT = int(os.getenv('CHECKER_LIST_LIMIT', '1000'))
 
-class FileInfo(BaseModel):
-    """
-    This class defines infos of a file
-    """
-    filename: str
-    date_time: datetime
-    file_size: ByteSize
-    compress_size: ByteSize
-    CRC: int
 
-
-def main(file_path: Path) -> str:
+def main(file_path: Path) -> Iterator[str]:
     """
     Verify, list files in a zip file.
 
@@ -23,20 +16,23 @@ def main(file_path: Path) -> str:
         file_path: file path
 
     Returns:
-        str: HTML output
+        Iterator[str]: HTML output
     """
 
     try:
         file = zipfile.ZipFile(file_path)
     except zipfile.BadZipFile:
-        return '<h2>压缩包已损坏，请重新打包上传。</h2>'
+        yield '<h2>压缩包已损坏，请重新打包上传。</h2>'
+        return
     except Exception as exception:  # pylint: disable=broad-except
-        return f'<h2>出现问题: {exception.args[0]}</h2>'
+        yield f'<h2>出现问题: {html.escape(str(exception.args[0]))}</h2>'
+        return
 
-    output, test_ok = test_zip(file)
-    if test_ok:
-        output += list_zip(file)
-    return output
+    with file:
+        output, test_ok = test_zip(file)
+        yield output
+        if test_ok:
+            yield from list_zip(file, LIST_LIMIT)
 
 
 def test_zip(obj: zipfile.ZipFile) -> (str, bool):
@@ -53,26 +49,43 @@ def test_zip(obj: zipfile.ZipFile) -> (str, bool):
     try:
         result = obj.testzip()
     except Exception as exception:  # pylint: disable=broad-except
-        return f'<h2>出现问题: {exception.args[0]}</h2>', False
+        return f'<h2>出现问题: {html.escape(str(exception.args[0]))}</h2>', False
 
     if result:
         return '<h2>压缩包已损坏，请重新打包上传。</h2>', False
     return '<h2>压缩包文件完好。</h2>', True
 
 
-def list_zip(obj) -> str:
+def human_readable(size: int) -> str:
     """
-    List files in a zip file.
+    Format a size in bytes.
 
     Args:
-        obj: a ZipFile object
+        size: the size
 
     Returns:
-        str: HTML output
+        str: the formatted size
     """
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return f'{size}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}GiB'
 
-    try:
-        head = '''
+
+def list_zip(obj: zipfile.ZipFile, limit: int) -> Iterator[str]:
+    """
+    List files in a zip file, in one pass over its entries.
+    Entries beyond limit are summed up in the last row.
+
+    Args:
+        obj: a ZipFile object
+        limit: entries listed at most
+
+    Returns:
+        Iterator[str]: HTML output
+    """
+    yield '''
         <table class="table table-hover align-middle"><thead><tr>
         <th scope="col">文件名称</th>
         <th scope="col">修改的时间日期</th>
@@ -80,22 +93,21 @@ def list_zip(obj) -> str:
         <th scope="col">已压缩数据的大小</th>
         <th scope="col">未压缩文件的 CRC-32</th>
         </tr></thead><tbody>'''
-        body = ''
-        for info_obj in obj.infolist():
-            fileinfo = FileInfo(filename=info_obj.filename,
-                                date_time=datetime(*info_obj.date_time),
-                                file_size=info_obj.file_size,
-                                compress_size=info_obj.compress_size,
-                                CRC=info_obj.CRC,
-                                )
-            body += f'''<tr>
-            <td scope="row">{fileinfo.filename}</td>
-            <td>{fileinfo.date_time}</td>
-            <td>{fileinfo.file_size.human_readable()}</td>
-            <td>{fileinfo.compress_size.human_readable()}</td>
-            <td>{fileinfo.CRC}</td>
-            </tr>'''
-        foot = '''</tbody></table>'''
-        return head + body + foot
-    except Exception as exception:  # pylint: disable=broad-except
-        return f'<h2>出现问题: {exception.args[0]}</h2>'
+    hidden = hidden_size = hidden_compress_size = 0
+    for count, info in enumerate(obj.infolist()):
+        if count >= limit:
+            hidden += 1
+            hidden_size += info.file_size
+            hidden_compress_size += info.compress_size
+            continue
+        year, month, day, hour, minute, second = info.date_time
+        yield (f'<tr><td scope="row">{html.escape(info.filename)}</td>'
+               f'<td>{year:04}-{month:02}-{day:02} {hour:02}:{minute:02}:{second:02}</td>'
+               f'<td>{human_readable(info.file_size)}</td>'
+               f'<td>{human_readable(info.compress_size)}</td>'
+               f'<td>{info.CRC}</td></tr>')
+    if hidden:
+        yield (f'<tr><td scope="row">还有 {hidden} 个文件未列出</td><td></td>'
+               f'<td>{human_readable(hidden_size)}</td>'
+               f'<td>{human_readable(hidden_compress_size)}</td><td></td></tr>')
+    yield '</tbody></table>'
@@ -0,0 +1,162 @@
+from email.utils import formatdate
+from typing import BinaryIO, Optional, Tuple
+import mimetypes
+import re
+
+from fastapi import Request, Response, status
+from starlette.concurrency import run_in_threadpool
+
+from render import cache_headers, is_not_modified, not_modified
+from storage import StoredFile, content_disposition
+
+# Bytes read at a time when the server can not send files by itself
+CHUNK_SIZE = 64 * 1024
+
+RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header of a single byte range.
+    Several ranges are answered with the whole file.
+
+    Args:
+        header: the Range header
+        size: size of the file
+
+    Returns:
+        Optional[Tuple[int, int]]: first and last byte of the range, None for the whole file
+
+    Raises:
+        ValueError: the range is not satisfiable
+    """
+    matched = RANGE.fullmatch(header.strip()) if header else None
+    if not matched or matched.group(1) == matched.group(2) == '':
+        return None
+    if matched.group(1) == '':
+        # the last bytes of the file
+        length = int(matched.group(2))
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(matched.group(1))
+    if start >= size:
+        raise ValueError(header)
+    end = int(matched.group(2)) if matched.group(2) else size - 1
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_etag(stored: StoredFile) -> str:
+    """
+    Make the ETag of a file from its time and size.
+
+    Args:
+        stored: the file
+
+    Returns:
+        str: the ETag
+    """
+    return f'"{stored.mtime_ns:x}-{stored.size:x}"'
+
+
+class FileRangeResponse(Response):
+    """
+    The response sending a range of an opened file, which it closes.
+    Servers offering the http.response.zerocopy extension send it from
+    the kernel, the file is read in chunks otherwise.
+    """
+
+    def __init__(self, file: BinaryIO, start: int, length: int,
+                 status_code: int, headers: dict, media_type: str):
+        """
+        Initialize the FileRangeResponse.
+
+        Args:
+            self: the instance
+            file: the opened file
+            start: first byte sent
+            length: count of bytes sent
+            status_code: status code of the response
+            headers: headers of the response
+            media_type: media type of the file
+
+        Returns:
+            FileRangeResponse
+        """
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.file = file
+        self.start = start
+        self.length = length
+        self.headers['Content-Length'] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({'type': 'http.response.start',
+                        'status': self.status_code,
+                        'headers': self.raw_headers})
+            if scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b''})
+            elif 'http.response.zerocopy' in scope.get('extensions', {}):
+                await send({'type': 'http.response.zerocopy', 'file': self.file,
+                            'offset': self.start, 'count': self.length})
+            else:
+                await run_in_threadpool(self.file.seek, self.start)
+                remaining = self.length
+                more_body = True
+                while more_body:
+                    chunk = await run_in_threadpool(self.file.read, min(CHUNK_SIZE, remaining)) \
+                        if remaining else b''
+                    remaining -= len(chunk)
+                    # a file truncated meanwhile ends the body short
+                    more_body = bool(chunk) and remaining > 0
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': more_body})
+        finally:
+            await run_in_threadpool(self.file.close)
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(request: Request, file: BinaryIO, stored: StoredFile,
+                  filename: str) -> Response:
+    """
+    Answer a download of an opened file, honouring If-None-Match, Range and If-Range.
+    The file is closed by the response, or here if it is not sent.
+
+    Args:
+        request: request from client
+        file: the opened file
+        stored: size and time of the opened file
+        filename: name of the file downloaded
+
+    Returns:
+        Response: the response
+    """
+    etag = file_etag(stored)
+    headers = dict(cache_headers(etag), **{
+        'Accept-Ranges': 'bytes',
+        'Last-Modified': formatdate(stored.mtime_ns / 1e9, usegmt=True),
+        'Content-Disposition': content_disposition(filename),
+    })
+    if is_not_modified(request, etag):
+        file.close()
+        return not_modified(etag)
+
+    if_range = request.headers.get('if-range')
+    try:
+        byte_range = parse_range(request.headers.get('range'), stored.size) \
+            if if_range is None or if_range == etag else None
+    except ValueError:
+        file.close()
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                        headers={'Content-Range': f'bytes */{stored.size}'})
+
+    media_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if byte_range is None:
+        return FileRangeResponse(file, 0, stored.size, status.HTTP_200_OK, headers, media_type)
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+    return FileRangeResponse(file, start, end - start + 1, status.HTTP_206_PARTIAL_CONTENT,
+                             headers, media_type)
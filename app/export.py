@@ -0,0 +1,358 @@
+from collections.abc import Iterator
+from contextlib import closing
+from datetime import datetime
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+import csv
+import io
+import logging
+import tarfile
+import zipfile
+
+from storage import received_storage
+from store import Mission, StatusEnum, Student, Submission
+import config
+
+logger = logging.getLogger(__name__)
+
+# Rows of the matrix in csv sent at a time
+MATRIX_BATCH = 200
+
+
+class ExportEntry(NamedTuple):
+    """
+    The class defines a submission to export.
+    """
+    student: Student
+    submission: Submission
+
+
+class StreamBuffer(io.RawIOBase):
+    """
+    The write-only stream collecting archive bytes until they are sent.
+    """
+
+    def __init__(self):
+        """
+        Initialize the StreamBuffer.
+
+        Args:
+            self: the instance
+
+        Returns:
+            StreamBuffer
+        """
+        super().__init__()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self) -> bool:
+        """
+        If the stream is writable.
+
+        Args:
+            self: the instance
+
+        Returns:
+            bool: always True
+        """
+        return True
+
+    def write(self, data) -> int:
+        """
+        Collect written bytes.
+
+        Args:
+            self: the instance
+            data: the bytes
+
+        Returns:
+            int: count of bytes written
+        """
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        """
+        Get count of bytes written so far.
+
+        Args:
+            self: the instance
+
+        Returns:
+            int: the position
+        """
+        return self.position
+
+    def pop(self) -> bytes:
+        """
+        Take the bytes collected so far.
+
+        Args:
+            self: the instance
+
+        Returns:
+            bytes: the bytes
+        """
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def list_entries(mission: Mission, submissions: Dict[str, Submission],
+                 students: Dict[str, str], locked_only: bool) -> List[ExportEntry]:
+    """
+    List the submissions of a mission to export.
+
+    Args:
+        mission: the mission
+        submissions: submissions of the mission keyed by student id
+        students: students data
+        locked_only: only export locked submissions
+
+    Returns:
+        List[ExportEntry]: the submissions sorted by student id
+    """
+    entries = []
+    for stu_id, submission in sorted(submissions.items()):
+        if stu_id not in students:
+            continue
+        if locked_only and submission.status != StatusEnum.LOCKED:
+            continue
+        entries.append(ExportEntry(Student(stu_id, students[stu_id]),
+                                   submission))
+    return entries
+
+
+def iter_chunks(file: BinaryIO, size: int) -> Iterator[bytes]:
+    """
+    Read size bytes of a file in chunks.
+
+    Args:
+        file: the opened file
+        size: count of bytes to read
+
+    Returns:
+        Iterator[bytes]: the chunks
+    """
+    while size > 0:
+        chunk = file.read(min(config.UPLOAD_CHUNK_SIZE, size))
+        if not chunk:
+            break
+        size -= len(chunk)
+        yield chunk
+
+
+def make_manifest(rows: List[list]) -> bytes:
+    """
+    Make the manifest of an archive in csv.
+
+    Args:
+        rows: a row of each exported file
+
+    Returns:
+        bytes: the manifest
+    """
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(['stu_id', 'name', 'status', 'file', 'size', 'time', 'sha256'])
+    writer.writerows(rows)
+    return text.getvalue().encode('utf-8-sig')
+
+
+def iter_zip(mission: Mission, entries: List[ExportEntry]) -> Iterator[bytes]:
+    """
+    Generate a zip archive of submissions, with a manifest, on the fly.
+    Files are stored uncompressed, most of them are archives already.
+
+    Args:
+        mission: the mission
+        entries: the submissions
+
+    Returns:
+        Iterator[bytes]: the archive
+    """
+    stream = StreamBuffer()
+    rows = []
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED,
+                         allowZip64=True) as archive:
+        for student, submission in entries:
+            name = config.get_file_name(student, mission.ext)
+            try:
+                file, stored = received_storage.open(submission.path)
+            except FileNotFoundError:
+                logger.warning('export skipped: %s', submission.path)
+                continue
+            with closing(file):
+                info = zipfile.ZipInfo(name, stored.mtime.timetuple()[:6])
+                with archive.open(info, 'w', force_zip64=True) as target:
+                    for chunk in iter_chunks(file, stored.size):
+                        target.write(chunk)
+                        yield stream.pop()
+            rows.append([student.stu_id, student.name, submission.status.value, name,
+                         stored.size, stored.mtime.isoformat(),
+                         submission.sha256 or ''])
+        archive.writestr('manifest.csv', make_manifest(rows))
+    yield stream.pop()
+
+
+def iter_tar(mission: Mission, entries: List[ExportEntry]) -> Iterator[bytes]:
+    """
+    Generate a tar archive of submissions, with a manifest, on the fly.
+
+    Args:
+        mission: the mission
+        entries: the submissions
+
+    Returns:
+        Iterator[bytes]: the archive
+    """
+    rows = []
+
+    def tar_member(name: str, size: int, mtime: float) -> bytes:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        return info.tobuf(format=tarfile.PAX_FORMAT)
+
+    def tar_padding(size: int) -> bytes:
+        return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+    for student, submission in entries:
+        name = config.get_file_name(student, mission.ext)
+        try:
+            file, stored = received_storage.open(submission.path)
+        except FileNotFoundError:
+            logger.warning('export skipped: %s', submission.path)
+            continue
+        with closing(file):
+            yield tar_member(name, stored.size, stored.mtime_ns / 1e9)
+            yield from iter_chunks(file, stored.size)
+            yield tar_padding(stored.size)
+        rows.append([student.stu_id, student.name, submission.status.value, name,
+                     stored.size, stored.mtime.isoformat(),
+                     submission.sha256 or ''])
+
+    manifest = make_manifest(rows)
+    yield tar_member('manifest.csv', len(manifest), datetime.now().timestamp())
+    yield manifest
+    yield tar_padding(len(manifest))
+    yield b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+def matrix_cell(submission: Optional[Submission]) -> Tuple[str, Optional[int], Optional[str]]:
+    """
+    Get the status, size and time of a cell of the matrix.
+
+    Args:
+        submission: the submission, None if not submitted
+
+    Returns:
+        Tuple[str, Optional[int], Optional[str]]: name of the status, size and iso time
+    """
+    if submission is None:
+        return StatusEnum.EMPTY.name, None, None
+    return submission.status.name, int(submission.size), submission.mtime.isoformat()
+
+
+def count_mission(submissions: Dict[str, Submission], students: Dict[str, str]) -> Dict[str, int]:
+    """
+    Count the students of each status in a mission.
+    A student is counted once, by the file shown to the student.
+
+    Args:
+        submissions: submissions of the mission keyed by student id
+        students: students data
+
+    Returns:
+        Dict[str, int]: count of students by name of the status
+    """
+    counts = {status.name: 0 for status in StatusEnum}
+    for stu_id, submission in submissions.items():
+        if stu_id in students:
+            counts[submission.status.name] += 1
+    counts[StatusEnum.EMPTY.name] = len(students) - \
+        counts[StatusEnum.LOCKED.name] - counts[StatusEnum.UPLOADED.name]
+    return counts
+
+
+def build_matrix(missions: Dict[str, Mission],
+                 submissions: Dict[str, Dict[str, Submission]],
+                 students: Dict[str, str]) -> dict:
+    """
+    Build the status of every student in every mission, with completion counts.
+
+    Args:
+        missions: missions data
+        submissions: submissions keyed by mission url and student id
+        students: students data
+
+    Returns:
+        dict: the missions and the students, both sorted
+    """
+    mission_urls = sorted(missions)
+    mission_list = []
+    for mission_url in mission_urls:
+        counts = count_mission(submissions.get(mission_url, {}), students)
+        mission_list.append({'mission_url': mission_url,
+                             'name': missions[mission_url].name,
+                             'deadline': missions[mission_url].deadline.isoformat(),
+                             'counts': counts,
+                             'completed': len(students) - counts[StatusEnum.EMPTY.name]})
+    # cells are built once per submission, and the empty one is shared
+    empty = dict(zip(['status', 'size', 'time'], matrix_cell(None)))
+    columns = [{stu_id: dict(zip(['status', 'size', 'time'], matrix_cell(submission)))
+                for stu_id, submission in submissions.get(mission_url, {}).items()}
+               for mission_url in mission_urls]
+    student_list = []
+    for stu_id in sorted(students):
+        cells = {mission_url: column.get(stu_id, empty)
+                 for mission_url, column in zip(mission_urls, columns)}
+        student_list.append({'stu_id': stu_id, 'name': students[stu_id], 'missions': cells})
+    return {'students_count': len(students), 'missions': mission_list,
+            'students': student_list}
+
+
+def iter_matrix_csv(missions: Dict[str, Mission],
+                    submissions: Dict[str, Dict[str, Submission]],
+                    students: Dict[str, str]) -> Iterator[bytes]:
+    """
+    Generate the matrix in csv, a row for each student and three columns
+    for each mission, ending with a row of completion counts and total sizes.
+
+    Args:
+        missions: missions data
+        submissions: submissions keyed by mission url and student id
+        students: students data
+
+    Returns:
+        Iterator[bytes]: the csv, in batches of MATRIX_BATCH rows
+    """
+    mission_urls = sorted(missions)
+    empty = matrix_cell(None)
+    columns = [{stu_id: matrix_cell(submission)
+                for stu_id, submission in submissions.get(mission_url, {}).items()}
+               for mission_url in mission_urls]
+    text = io.StringIO()
+    # the BOM lets spreadsheets read the names in UTF-8
+    text.write('\ufeff')
+    writer = csv.writer(text)
+    header = ['stu_id', 'name']
+    for mission_url in mission_urls:
+        header += [f'{mission_url}:status', f'{mission_url}:size', f'{mission_url}:time']
+    writer.writerow(header)
+    for count, stu_id in enumerate(sorted(students), 1):
+        row = [stu_id, students[stu_id]]
+        for column in columns:
+            row += column.get(stu_id, empty)
+        writer.writerow(row)
+        if count % MATRIX_BATCH == 0:
+            yield text.getvalue().encode('utf-8')
+            text.seek(0)
+            text.truncate()
+    row = ['', 'completed']
+    for column in columns:
+        cells = [column[stu_id] for stu_id in column if stu_id in students]
+        row += [len(cells), sum(size for _, size, _ in cells), '']
+    writer.writerow(row)
+    yield text.getvalue().encode('utf-8')
@@ -0,0 +1,176 @@
+from collections.abc import Awaitable, Callable
+from typing import Optional, Union
+import logging
+
+from multipart.multipart import parse_options_header
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from admission import UPLOAD_PATH
+from metrics import ADMISSION_REJECTED
+from store import Mission
+from upload import allowed_file
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a form allowed besides the file: boundaries, part headers and the file name
+FORM_OVERHEAD = 16 * 1024
+# Bytes read at most from the body to find the headers of the first part
+HEAD_LIMIT = 16 * 1024
+
+
+class BodyTooLarge(Exception):
+    """
+    The exception raised to stop reading a body larger than allowed.
+    """
+
+
+def first_filename(head: bytes, content_type: str) -> Optional[str]:
+    """
+    Find the file name in the headers of the first part of a multipart body.
+
+    Args:
+        head: the start of the body
+        content_type: the Content-Type of the request
+
+    Returns:
+        Optional[str]: the file name, None if not found
+    """
+    media_type, params = parse_options_header(content_type)
+    boundary = params.get(b'boundary')
+    if media_type != b'multipart/form-data' or not boundary:
+        return None
+    start = head.find(b'--' + boundary)
+    end = head.find(b'\r\n\r\n', start)
+    if start == -1 or end == -1:
+        return None
+    for line in head[start:end].split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-disposition':
+            filename = parse_options_header(value)[1].get(b'filename')
+            return filename.decode('UTF-8', 'replace') if filename is not None else None
+    return None
+
+
+class UploadGuard:
+    """
+    The ASGI middleware checking a submission before its body is read.
+    The student and the mission are checked first, then the Content-Length
+    and the file name in the headers of the first part; a body going past
+    the size of the mission is cut off as it arrives. Rejected ones are
+    answered at once, the rest of the body is never read.
+    """
+
+    def __init__(self, app,
+                 check: Callable[[dict, str], Awaitable[Union[Mission, Response]]],
+                 reject: Callable[[str, Mission, str], Response]):
+        """
+        Initialize the UploadGuard.
+
+        Args:
+            self: the instance
+            app: the ASGI app
+            check: coroutine getting the mission of a submission from its scope and mission url,
+                or the response rejecting it
+            reject: gets the response rejecting a submission to a mission,
+                for a reason of 'size' or 'ext'
+
+        Returns:
+            UploadGuard
+        """
+        self.app = app
+        self.check = check
+        self.reject = reject
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            await self.app(scope, receive, send)
+            return
+        matched = UPLOAD_PATH.fullmatch(scope['path'])
+        if not matched:
+            await self.app(scope, receive, send)
+            return
+
+        mission_url = matched.group(1)
+        mission = await self.check(scope, mission_url)
+        if isinstance(mission, Response):
+            await mission(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        limit = int(mission.size) + FORM_OVERHEAD
+        try:
+            length = int(headers.get('content-length', ''))
+        except ValueError:
+            length = None
+        if length is not None and length > limit:
+            await self.rejected(mission_url, mission, 'size', length)(scope, receive, send)
+            return
+
+        buffered = []
+        head = b''
+        more_body = True
+        while more_body and len(head) < HEAD_LIMIT and b'\r\n\r\n' not in head:
+            message = await receive()
+            buffered.append(message)
+            if message['type'] != 'http.request':
+                break
+            head += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        if len(head) > limit:
+            await self.rejected(mission_url, mission, 'size', len(head))(scope, receive, send)
+            return
+        filename = first_filename(head, headers.get('content-type', ''))
+        if filename is not None and not allowed_file(filename, mission.ext):
+            await self.rejected(mission_url, mission, 'ext', filename)(scope, receive, send)
+            return
+
+        received = len(head)
+        too_large = False
+        started = False
+
+        async def guarded_receive() -> dict:
+            nonlocal received, too_large
+            if buffered:
+                return buffered.pop(0)
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    too_large = True
+                    raise BodyTooLarge(received)
+            return message
+
+        async def guarded_send(message: dict) -> None:
+            nonlocal started
+            # the answer of the app to a body cut off is replaced
+            if too_large:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, guarded_receive, guarded_send)
+        except Exception:  # pylint: disable=broad-except
+            if not too_large:
+                raise
+        if too_large and not started:
+            await self.rejected(mission_url, mission, 'size', received)(scope, receive, send)
+
+    def rejected(self, mission_url: str, mission: Mission, reason: str, detail) -> Response:
+        """
+        Count and log a rejected submission, and get its response.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            mission: the mission
+            reason: 'size' or 'ext'
+            detail: size or file name of the upload, for the log
+
+        Returns:
+            Response: the response
+        """
+        ADMISSION_REJECTED.inc(f'guard_{reason}')
+        logger.warning('upload rejected: %s %s %s', mission_url, reason, detail)
+        return self.reject(mission_url, mission, reason)
@@ -0,0 +1,247 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import uuid
+
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from checker import CheckerCache, CheckerPool
+from metrics import is_alive
+from storage import received_storage
+from store import Store, Submission
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Job(BaseModel):
+    """
+    The class defines a checker run queued for a submitted file.
+    """
+    key: str
+    mission_url: str
+    stu_id: str
+    path: Path
+    size: int
+    mtime_ns: int
+    checker_hash: str
+    created: datetime
+
+
+class JobQueue:
+    """
+    The persistent queue of checker runs, shared by all workers on local storage.
+    A job is a file named after its cache key; queued ones end with .job,
+    and a worker claims one by renaming it to end with its pid and .run.
+    """
+    path: Path
+
+    def __init__(self, path: Path):
+        """
+        Initialize the JobQueue.
+
+        Args:
+            self: the instance
+            path: directory of the queue
+
+        Returns:
+            JobQueue
+        """
+        self.path = path
+        self.wakeup = asyncio.Event()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def enqueue(self, mission_url: str, stu_id: str, submission: Submission,
+                checker_hash: str) -> Job:
+        """
+        Queue the checker run of a submitted file, waking up the runners.
+        A file already queued is not queued twice. Called from a thread.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            stu_id: student id
+            submission: the submitted file
+            checker_hash: hash of the checker source
+
+        Returns:
+            Job: the job
+        """
+        job = Job(key=CheckerCache.make_key(mission_url, submission, checker_hash),
+                  mission_url=mission_url,
+                  stu_id=stu_id,
+                  path=submission.path,
+                  size=int(submission.size),
+                  mtime_ns=submission.mtime_ns,
+                  checker_hash=checker_hash,
+                  created=datetime.now())
+        job_path = self.path / f'{job.key}.job'
+        if not job_path.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path / f'.{uuid.uuid4().hex}.part'
+            temp_path.write_text(job.json(), encoding='UTF-8')
+            os.replace(temp_path, job_path)
+            logger.debug({'job_queued': job.key, 'mission': mission_url, 'stu_id': stu_id})
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        return job
+
+    def claim(self) -> Optional[Job]:
+        """
+        Claim the oldest queued job.
+
+        Args:
+            self: the instance
+
+        Returns:
+            Optional[Job]: the job, None if the queue is empty
+        """
+        if not self.path.is_dir():
+            return None
+        queued = []
+        with os.scandir(self.path) as iterator:
+            for entry in iterator:
+                if entry.name.endswith('.job'):
+                    try:
+                        queued.append((entry.stat().st_mtime_ns, entry.name))
+                    except FileNotFoundError:
+                        continue
+        for _, name in sorted(queued):
+            job_path = self.path / name
+            run_path = self.path / f'{job_path.stem}.{os.getpid()}.run'
+            try:
+                os.rename(job_path, run_path)
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+            try:
+                return Job.parse_file(run_path)
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.warning('job invalid: %s %s', name, exception)
+                run_path.unlink(missing_ok=True)
+        return None
+
+    def finish(self, job: Job) -> None:
+        """
+        Remove a claimed job.
+
+        Args:
+            self: the instance
+            job: the job
+
+        Returns:
+            None
+        """
+        (self.path / f'{job.key}.{os.getpid()}.run').unlink(missing_ok=True)
+
+    def recover(self) -> None:
+        """
+        Queue again the jobs claimed by workers which are gone.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        if not self.path.is_dir():
+            return
+        for run_path in self.path.glob('*.run'):
+            key, pid, _ = run_path.name.split('.')
+            if not is_alive(int(pid)):
+                logger.info('job recovered: %s', key)
+                try:
+                    os.rename(run_path, self.path / f'{key}.job')
+                except FileNotFoundError:
+                    continue
+
+    def depth(self) -> Dict[str, int]:
+        """
+        Count the queued and running jobs.
+
+        Args:
+            self: the instance
+
+        Returns:
+            Dict[str, int]: count of jobs by state
+        """
+        counts = {'queued': 0, 'running': 0}
+        if not self.path.is_dir():
+            return counts
+        with os.scandir(self.path) as iterator:
+            for entry in iterator:
+                if entry.name.endswith('.job'):
+                    counts['queued'] += 1
+                elif entry.name.endswith('.run'):
+                    counts['running'] += 1
+        return counts
+
+
+def is_current(job: Job, store: Store) -> bool:
+    """
+    Check if a job still matches the submitted file and the checker.
+    A job outdated by a newer upload or checker is dropped, the newer
+    one is queued on its own.
+
+    Args:
+        job: the job
+        store: the store
+
+    Returns:
+        bool: if the job is current
+    """
+    if store.checker_hashes.get(job.mission_url) != job.checker_hash:
+        return False
+    stored = received_storage.stat(job.path)
+    if stored is None:
+        return False
+    return (stored.size, stored.mtime_ns) == (job.size, job.mtime_ns)
+
+
+async def run_jobs(queue: JobQueue, pool: CheckerPool, store: Store) -> None:
+    """
+    Run queued jobs in the checker pool, forever.
+    Each worker runs CHECKER_WORKERS of these, and polls the queue every
+    JOB_POLL_INTERVAL seconds for jobs queued by other workers.
+
+    Args:
+        queue: the queue
+        pool: the checker pool
+        store: the store
+
+    Returns:
+        None
+    """
+    queue.loop = asyncio.get_running_loop()
+    while True:
+        try:
+            queue.wakeup.clear()
+            job = await run_in_threadpool(queue.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(queue.wakeup.wait(), config.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                if await run_in_threadpool(is_current, job, store):
+                    file_path = await run_in_threadpool(received_storage.fetch, job.path)
+                    try:
+                        await pool.check(job.key, job.mission_url,
+                                         store.checkers[job.mission_url], file_path)
+                    finally:
+                        await run_in_threadpool(received_storage.discard, job.path, file_path)
+            except asyncio.CancelledError:
+                # left claimed, to be recovered after restart
+                raise
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.exception('job failed: %s %s', job.key, exception)
+            await run_in_threadpool(queue.finish, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.exception('job failed: %s', exception)
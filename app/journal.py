@@ -0,0 +1,412 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import fcntl
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from snapshot import Stamp
+import config
+
+logger = logging.getLogger(__name__)
+
+# Operation of the records a compacted journal starts with, one per submission
+STATE_OP = 'state'
+
+
+def dump_record(record: dict) -> bytes:
+    """
+    Encode a record as a line of the journal.
+
+    Args:
+        record: the record
+
+    Returns:
+        bytes: the line
+    """
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('UTF-8') + b'\n'
+
+
+def fold_records(content: bytes) -> Optional[Tuple[Optional[Stamp], Dict[str, dict]]]:
+    """
+    Replay the lines of a journal.
+    An unfinished last line, being appended or cut off by a crash, is skipped.
+
+    Args:
+        content: the lines
+
+    Returns:
+        Optional[Tuple[Optional[Stamp], Dict[str, dict]]]: stamp of the mission directory
+            after the last record, and the last record of each student with a submission;
+            None if a line is invalid
+    """
+    lines = content[:content.rfind(b'\n') + 1].rstrip(b'\n')
+    stamp = None
+    records = {}
+    try:
+        # lines hold no raw newline, they are decoded as one array at once
+        for record in json.loads(b'[' + lines.replace(b'\n', b',') + b']'):
+            if record['new'] is None:
+                records.pop(record['student'], None)
+            else:
+                records[record['student']] = record
+            stamp = record['dir']
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return tuple(stamp) if stamp else None, records
+
+
+class SubmissionJournal:
+    """
+    The append-only journals of uploads and locks, one per mission, in
+    JSON lines. Records are written at once, visible to every worker, and
+    fsynced every JOURNAL_FSYNC_INTERVAL seconds. A journal with
+    JOURNAL_COMPACT_RECORDS uploads and locks is compacted to the last
+    record of each student; the records dropped are appended to its
+    gzipped archive, which with the journal is the audit trail.
+    Appends and compactions across processes are serialized by flock.
+    """
+    directory: Path
+
+    def __init__(self, directory: Path):
+        """
+        Initialize the SubmissionJournal.
+
+        Args:
+            self: the instance
+            directory: directory of the journals
+
+        Returns:
+            SubmissionJournal
+        """
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.fds: Dict[str, int] = {}
+        self.appended: Dict[str, int] = {}
+        self.dirty = set()
+        self.flusher: Optional[threading.Thread] = None
+
+    def path(self, mission_url: str) -> Path:
+        """
+        Get the path of the journal of a mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            Path: the path
+        """
+        return self.directory / f'{mission_url}.jsonl'
+
+    def archive_path(self, mission_url: str) -> Path:
+        """
+        Get the path of the archive of a mission, of the records compacted away.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            Path: the path
+        """
+        return self.directory / f'{mission_url}.jsonl.gz'
+
+    def forked(self) -> None:
+        """
+        Drop the files opened by the parent process, flock does not
+        tell apart processes sharing them.
+        Must hold the lock.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        if self.pid == os.getpid():
+            return
+        for fd in self.fds.values():
+            os.close(fd)
+        self.pid = os.getpid()
+        self.fds = {}
+        self.appended = {}
+        self.dirty = set()
+        self.flusher = None
+
+    @contextmanager
+    def locked(self, mission_url: str) -> Iterator[int]:
+        """
+        Lock the journal of a mission against other processes, reopening
+        it if it was replaced by a compaction.
+        Must hold the lock.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            Iterator[int]: the file descriptor of the journal, opened for appending
+        """
+        path = self.path(mission_url)
+        while True:
+            fd = self.fds.get(mission_url)
+            if fd is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                fd = self.fds[mission_url] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                                     0o644)
+                self.appended[mission_url] = self.count(path)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                current = path.stat().st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(fd).st_ino:
+                break
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            del self.fds[mission_url]
+        try:
+            yield fd
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def count(path: Path) -> int:
+        """
+        Count the uploads and locks in a journal, which are not compacted yet.
+
+        Args:
+            path: path of the journal
+
+        Returns:
+            int: count of records
+        """
+        try:
+            lines = path.read_bytes().splitlines()
+        except FileNotFoundError:
+            return 0
+        state = f'"op":"{STATE_OP}"'.encode('UTF-8')
+        return sum(1 for line in lines if state not in line)
+
+    def append(self, mission_url: str, record: dict) -> None:
+        """
+        Append a record to the journal of a mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            record: the record
+
+        Returns:
+            None
+        """
+        line = dump_record(record)
+        with self.lock:
+            self.forked()
+            with self.locked(mission_url) as fd:
+                os.write(fd, line)
+            self.appended[mission_url] += 1
+            self.dirty.add(mission_url)
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run_flusher, daemon=True)
+                self.flusher.start()
+
+    def replay(self, mission_url: str) -> Optional[Tuple[Optional[Stamp], Dict[str, dict]]]:
+        """
+        Replay the journal of a mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            Optional[Tuple[Optional[Stamp], Dict[str, dict]]]: stamp of the mission directory
+                after the last record, and the last record of each student with a submission;
+                None if there is no valid journal
+        """
+        try:
+            content = self.path(mission_url).read_bytes()
+        except FileNotFoundError:
+            return None
+        return fold_records(content)
+
+    def rebase(self, mission_url: str, records: Dict[str, dict],
+               stamp: Optional[Stamp]) -> None:
+        """
+        Replace the journal of a mission with the state of its submissions,
+        as scanned when the journal did not match the mission directory.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            records: the last record of each student with a submission
+            stamp: stamp of the mission directory, taken before the scan
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.forked()
+            with self.locked(mission_url):
+                self.replace(mission_url, records, stamp)
+
+    def compact(self, mission_url: str) -> None:
+        """
+        Compact the journal of a mission to the last record of each student.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.forked()
+            with self.locked(mission_url):
+                folded = self.replay(mission_url)
+                if folded is None:
+                    logger.warning('journal invalid, not compacted: %s', mission_url)
+                    self.appended[mission_url] = 0
+                    return
+                stamp, records = folded
+                self.replace(mission_url, records, stamp)
+
+    def replace(self, mission_url: str, records: Dict[str, dict],
+                stamp: Optional[Stamp]) -> None:
+        """
+        Write the state records of a journal, archiving its uploads and locks.
+        Must hold the lock, and the flock of the journal.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            records: the last record of each student with a submission
+            stamp: stamp of the mission directory
+
+        Returns:
+            None
+        """
+        path = self.path(mission_url)
+        content = path.read_bytes()
+        state = f'"op":"{STATE_OP}"'.encode('UTF-8')
+        archived = b''.join(line for line in content.splitlines(keepends=True)
+                            if line.endswith(b'\n') and state not in line)
+        if archived:
+            with gzip.open(self.archive_path(mission_url), 'ab') as archive:
+                archive.write(archived)
+                archive.flush()
+                os.fsync(archive.fileno())
+
+        dir_stamp = list(stamp) if stamp else None
+        lines = b''.join(dump_record(dict(record, op=STATE_OP, dir=dir_stamp))
+                         for _, record in sorted(records.items()))
+        temp_path = self.directory / f'.{uuid.uuid4().hex}.part'
+        try:
+            with open(temp_path, 'wb') as temp:
+                temp.write(lines)
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, path)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+        # appenders holding the old file, this process included, reopen the new one
+        self.appended[mission_url] = 0
+        self.dirty.discard(mission_url)
+        logger.info('journal compacted: %s, %d records, %d bytes archived',
+                    mission_url, len(records), len(archived))
+
+    def records(self, mission_url: str) -> Iterator[dict]:
+        """
+        Read every record of a mission, archived ones first.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            Iterator[dict]: the records, oldest first
+        """
+        try:
+            with gzip.open(self.archive_path(mission_url), 'rb') as archive:
+                for line in archive:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            pass
+        try:
+            content = self.path(mission_url).read_bytes()
+        except FileNotFoundError:
+            return
+        for line in content.splitlines(keepends=True):
+            if line.endswith(b'\n'):
+                record = json.loads(line)
+                if record['op'] != STATE_OP:
+                    yield record
+
+    def flush(self) -> None:
+        """
+        Fsync the journals appended to, and compact the large ones.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.forked()
+            fds = [os.dup(self.fds[mission_url]) for mission_url in self.dirty
+                   if mission_url in self.fds]
+            self.dirty = set()
+            full = [mission_url for mission_url, count in self.appended.items()
+                    if count >= config.JOURNAL_COMPACT_RECORDS]
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for mission_url in full:
+            self.compact(mission_url)
+
+    def run_flusher(self) -> None:
+        """
+        Flush the journals every JOURNAL_FSYNC_INTERVAL seconds, forever.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        while True:
+            time.sleep(config.JOURNAL_FSYNC_INTERVAL)
+            try:
+                self.flush()
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.warning('journal flush failed: %s', exception)
+
+    def close(self) -> None:
+        """
+        Flush the journals and close them.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        self.flush()
+        with self.lock:
+            self.forked()
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds = {}
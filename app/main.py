@@ -1,21 +1,72 @@
-from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Union
+import asyncio
 import logging
+import secrets
+import time
 
-from fastapi import Cookie, Depends, FastAPI, Request, File, UploadFile, status
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import Cookie, Depends, FastAPI, Header, HTTPException, Query, Request, File, \
+    UploadFile, status
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, \
+    RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from store import Store, Student, MissionStatus, StatusEnum
+from starlette.concurrency import run_in_threadpool
+from admission import AdmissionMiddleware
+from assets import AssetFiles, static_assets
+from checker import CheckerPool, preload_checkers
+from download import file_response
+from export import build_matrix, iter_matrix_csv, iter_tar, iter_zip, list_entries
+from guard import UploadGuard
+from jobs import JobQueue, run_jobs
+from journal import dump_record
+from metrics import UPLOADS_IN_FLIGHT, UPLOAD_SIZE, UPLOAD_THROUGHPUT, Gauge, \
+    MetricsMiddleware, generate
+from render import cache_headers, fragment_cache, is_not_modified, make_etag, \
+    mission_version, not_modified, row_version, submission_version
+from storage import received_storage
+from store import Mission, Store, Student, MissionStatus, StatusEnum, Submission
+from upload import FileTooLarge, OffsetMismatch, SessionBusy, UploadSession, \
+    allowed_file, create_session, finalize_session, load_session, save_upload, session_offset, \
+    write_chunk
 import config
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory='templates')
+logger = logging.getLogger(__name__)
 
+boot_start = time.perf_counter()
 store = Store()
+store_ready = time.perf_counter()
+static_assets.build()
+assets_ready = time.perf_counter()
+checker_pool = CheckerPool()
+job_queue = JobQueue(config.jobs_path)
+background_tasks: List[asyncio.Task] = []
+if config.CHECKER_PRELOAD:
+    preload_checkers(store.checkers)
+logger.info('STARTUP store %.1fms, static %.1fms, checkers %.1fms',
+            1000 * (store_ready - boot_start), 1000 * (assets_ready - store_ready),
+            1000 * (time.perf_counter() - assets_ready))
+Gauge('collector_index_submissions', 'Submissions in the index.', mode='max',
+      function=lambda: sum(map(len, list(store.index.submissions.values()))))
+Gauge('collector_jobs_queued', 'Checker jobs waiting in the queue.', mode='max',
+      function=lambda: job_queue.depth()['queued'])
+
+
+def sync_store() -> None:
+    """
+    Catch up with store changes published by the master process.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    store.sync()
 
-logger = logging.getLogger(__name__)
+
+app = FastAPI(dependencies=[Depends(sync_store)])
+app.mount("/static", AssetFiles(static_assets), name="static")
+templates = Jinja2Templates(directory='templates')
+templates.env.globals['static_url'] = static_assets.url
 
 def encode_cookies(string_to_encode: str) -> str:
     """
@@ -105,11 +156,142 @@ def get_stu_obj(stu_id: Optional[str] = Depends(get_stu_id)) -> Student:
     Returns:
         Student: student obj
     """
-    stu_obj = Student(stu_id=stu_id, name=store.students[stu_id])
+    stu_obj = store.get_student(stu_id)
     logger.debug({'stu_obj': stu_obj})
     return stu_obj
 
 
+async def check_upload(scope: dict, mission_url: str) -> Union[Mission, Response]:
+    """
+    Check the student and the mission of a submission before its body is read.
+    The store is synced in the threadpool, off the event loop.
+
+    Args:
+        scope: scope of the request
+        mission_url: the url-name of the mission
+
+    Returns:
+        Union[Mission, Response]: the mission, or the response rejecting the submission
+    """
+    await run_in_threadpool(sync_store)
+    request = Request(scope)
+    stu_id = get_stu_id(request.query_params.get('stu_id'), request.cookies.get('stu_id_cookie'))
+    invalid = invalid_response(check_stu_id(stu_id))
+    if invalid:
+        return invalid
+    mission = store.missions.get(mission_url)
+    if mission is None:
+        return JSONResponse({'detail': '任务不存在。'}, status_code=status.HTTP_404_NOT_FOUND)
+    mission_status = MissionStatus(student=get_stu_obj(stu_id), mission=mission,
+                                   index=store.index)
+    if not mission_status.avaliable:
+        return reject_upload(mission_url, mission, 'closed')
+    return mission
+
+
+def reject_upload(mission_url: str, mission: Mission, reason: str) -> Response:
+    """
+    Generate the response rejecting a submission before its body is read.
+
+    Args:
+        mission_url: the url-name of the mission
+        mission: the mission
+        reason: 'closed', 'size' or 'ext'
+
+    Returns:
+        Response: response
+    """
+    info = {
+        'closed': '当前任务已无法提交。',
+        'size': f'文件超过大小限制({mission.size.human_readable()})。',
+        'ext': f'请上传{mission.ext}格式的文件。',
+    }[reason]
+    response = RedirectResponse(
+        url=f'/submit/{mission_url}', status_code=status.HTTP_303_SEE_OTHER)
+    response.set_cookie(key='info', value=encode_cookies(info))
+    # the rest of the body is not read, the connection can not be reused
+    response.headers['Connection'] = 'close'
+    return response
+
+
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(UploadGuard, check=check_upload, reject=reject_upload)
+app.add_middleware(MetricsMiddleware)
+
+
+def enqueue_check(mission_url: str, stu_id: str, submission: Optional[Submission]) -> None:
+    """
+    Queue the checker of a mission against a submitted file, if it has one.
+
+    Args:
+        mission_url: the url-name of the mission
+        stu_id: student id
+        submission: the submitted file
+
+    Returns:
+        None
+    """
+    if submission and mission_url in store.checker_hashes:
+        job_queue.enqueue(mission_url, stu_id, submission,
+                          store.checker_hashes[mission_url])
+
+
+async def rescan_storage() -> None:
+    """
+    Rebuild the index every STORAGE_RESCAN_INTERVAL seconds, forever.
+    Files saved by other nodes are not watched on a remote storage.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    while True:
+        await asyncio.sleep(config.STORAGE_RESCAN_INTERVAL)
+        try:
+            await run_in_threadpool(store.index.build, store.missions, store.students)
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('rescan failed: %s', exception)
+
+
+@app.on_event('startup')
+def startup() -> None:
+    """
+    Start running queued checker jobs, and rescanning a remote storage,
+    when the app starts.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    job_queue.recover()
+    for _ in range(config.CHECKER_WORKERS):
+        background_tasks.append(asyncio.ensure_future(run_jobs(job_queue, checker_pool, store)))
+    if not received_storage.watched:
+        background_tasks.append(asyncio.ensure_future(rescan_storage()))
+
+
+@app.on_event('shutdown')
+def shutdown() -> None:
+    """
+    Release resources when the app shuts down.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    for task in background_tasks:
+        task.cancel()
+    checker_pool.shutdown()
+    if store.index.journal is not None:
+        store.index.journal.close()
+
+
 @app.get('/', response_class=HTMLResponse)
 @app.get('/login', response_class=HTMLResponse)
 async def login(request: Request,
@@ -183,22 +365,28 @@ async def submit_list(request: Request,
     if invalid:
         return invalid
     stu_obj = get_stu_obj(stu_id)
-    missions_status = []
-    submitted = 0
-    for key in sorted(store.missions.keys()):
-        mission_status = await MissionStatus(student=stu_obj,
-                                             mission=store.missions[key])
-        await mission_status.get_finish_rate(len(store.students))
-        missions_status.append(mission_status)
-        if (await mission_status.file_info).submitted:
-            submitted += 1
-        logger.debug(missions_status)
-    return templates.TemplateResponse(
-        'missions.html', {'request': request,
-                          'student': stu_obj,
-                          'missions_status': missions_status,
-                          'now': datetime.today().strftime(config.DATETIME_FORMAT),
-                          'progress': 100 * submitted / len(store.missions)})
+    missions_status = store.get_missions_status(stu_obj)
+    rows_version = [row_version(mission_status) for mission_status in missions_status]
+    etag = make_etag('missions', stu_obj.name, rows_version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    def render_page() -> str:
+        rows = [fragment_cache.get_or_render(
+            make_etag('row', version),
+            lambda item=mission_status: templates.get_template(
+                'mission_row.html').render(item=item))
+            for mission_status, version in zip(missions_status, rows_version)]
+        submitted = sum(1 for mission_status in missions_status
+                        if mission_status.file_info.submitted)
+        return templates.get_template('missions.html').render(
+            request=request,
+            student=stu_obj,
+            rows=rows,
+            progress=100 * submitted / max(len(missions_status), 1))
+
+    return HTMLResponse(fragment_cache.get_or_render(etag, render_page),
+                        headers=cache_headers(etag))
 
 
 @app.get('/submit/{mission_url}', response_class=HTMLResponse)
@@ -225,38 +413,86 @@ async def submit_detailed(request: Request,
         return invalid
     stu_obj = get_stu_obj(stu_id)
 
-    mission_status = await MissionStatus(student=stu_obj,
-                                         mission=store.missions[mission_url])
+    mission_status = MissionStatus(student=stu_obj,
+                                   mission=store.missions[mission_url],
+                                   index=store.index)
 
     check_result = None
-    if mission_status.file_info.submitted and mission_url in store.checkers:
-        check_result = store.checkers[mission_url](mission_status.file_info.sub_file_path)
-
-    response = templates.TemplateResponse(
-        "submit.html", {'request': request,
-                        'info': decode_cookies(info),
-                        'now': datetime.today(),
-                        'mission_status': mission_status,
-                        'check_result': check_result})
+    check_pending = False
+    submission = store.index.get(mission_url, stu_obj.stu_id)
+    if submission and mission_url in store.checker_hashes:
+        check_result = await checker_pool.cached(mission_url,
+                                                 store.checker_hashes[mission_url],
+                                                 submission)
+        check_pending = check_result is None
+        if check_pending:
+            # files submitted before the checker changed are queued on view
+            await run_in_threadpool(enqueue_check, mission_url, stu_obj.stu_id, submission)
+
+    context = {'request': request,
+               'info': decode_cookies(info),
+               'mission_status': mission_status,
+               'check_result': check_result,
+               'check_pending': check_pending}
     if info:
+        # notifications are shown once, never cached
+        response = templates.TemplateResponse("submit.html", context)
         response.delete_cookie(key='info')
-    return response
-
+        return response
 
-def allowed_file(file: UploadFile, allowed_extension: str) -> bool:
+    etag = make_etag('submit', stu_obj.stu_id, stu_obj.name,
+                     mission_version(mission_status.mission),
+                     submission_version(submission),
+                     bool(mission_status.avaliable),
+                     store.checker_hashes.get(mission_url), check_pending)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    page = fragment_cache.get_or_render(
+        etag, lambda: templates.get_template('submit.html').render(context))
+    return HTMLResponse(page, headers=cache_headers(etag))
+
+
+@app.get('/submit/{mission_url}/file')
+async def submit_file(request: Request,
+                      mission_url: str,
+                      stu_id: Optional[str] = Depends(get_stu_id),
+                      invalid: Optional[HTMLResponse] = Depends(
+                          invalid_response)) -> Response:
     """
-    Check if the filename has allowed extension.
+    Download the submitted file, with Range and If-None-Match supported.
 
     Args:
-        file: file uploaded
-        allowed_extension: extension allowed
+        request: request from client
+        mission_url: the url-name of the mission
+        stu_id: provided student id
+        invalid: response when session is invalid
 
     Returns:
-        bool: if the filename has allowed extension
+        Response: the file, or the redirect to it on the s3 storage
     """
-    filename = file.filename
-    return '.' in filename and \
-        filename.rsplit('.', 1)[1].lower() == allowed_extension
+    if invalid:
+        return invalid
+    stu_obj = get_stu_obj(stu_id)
+    if mission_url not in store.missions:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='任务不存在。')
+
+    mission_status = MissionStatus(student=stu_obj,
+                                   mission=store.missions[mission_url],
+                                   index=store.index)
+    file_path = mission_status.file_info.sub_file_path
+    if file_path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='尚未提交文件。')
+
+    url = await run_in_threadpool(received_storage.link, file_path, file_path.name)
+    if url:
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    try:
+        file, stored = await run_in_threadpool(received_storage.open, file_path)
+    except FileNotFoundError as exception:
+        # locked or replaced meanwhile
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail='尚未提交文件。') from exception
+    return file_response(request, file, stored, file_path.name)
 
 
 @app.post('/submit/{mission_url}', response_class=HTMLResponse)
@@ -281,8 +517,9 @@ async def submit_handler(mission_url: str,
         return invalid
     stu_obj = get_stu_obj(stu_id)
 
-    mission_status = await MissionStatus(student=stu_obj,
-                                         mission=store.missions[mission_url])
+    mission_status = MissionStatus(student=stu_obj,
+                                   mission=store.missions[mission_url],
+                                   index=store.index)
     ext = mission_status.mission.ext
 
     response = RedirectResponse(
@@ -293,7 +530,7 @@ async def submit_handler(mission_url: str,
             key='info', value=encode_cookies('当前任务已无法提交。'))
         return response
 
-    if not allowed_file(file=file, allowed_extension=ext):
+    if not allowed_file(filename=file.filename, allowed_extension=ext):
         response.set_cookie(
             key='info', value=encode_cookies(f'请上传{ext}格式的文件。'))
         return response
@@ -301,17 +538,35 @@ async def submit_handler(mission_url: str,
     try:
         mission_path = config.received_path / mission_status.mission.subpath
         ucfp = mission_path / config.get_file_name(stu_obj, ext, False)
-
-        up_stream = await file.read(mission_status.mission.size)
-        with open(ucfp, "wb") as target:
-            target.write(up_stream)
-        target.close()
+        previous = store.index.get(mission_url, stu_obj.stu_id)
+
+        start = time.perf_counter()
+        UPLOADS_IN_FLIGHT.inc()
+        try:
+            saved = await save_upload(file, ucfp, mission_status.mission.size)
+        finally:
+            UPLOADS_IN_FLIGHT.dec()
+        UPLOAD_SIZE.observe(saved.size)
+        UPLOAD_THROUGHPUT.observe(saved.size / max(time.perf_counter() - start, 1e-6))
+        submission = await run_in_threadpool(store.index.record, 'upload',
+                                             mission_status.mission, stu_obj, previous)
+        await run_in_threadpool(enqueue_check, mission_url, stu_obj.stu_id, submission)
+    except FileTooLarge:
+        response.set_cookie(
+            key='info', value=encode_cookies(
+                f'文件超过大小限制({mission_status.mission.size.human_readable()})。'))
+        return response
     except Exception as exception:  # pylint: disable=broad-except
         response.set_cookie(
             key='info', value=encode_cookies(f'上传失败，请联系管理员。{exception.args[0]}'))
         logger.exception('upload failed: %s', exception.args[0])
         return response
 
+    if not saved.changed:
+        response.set_cookie(
+            key='info', value=encode_cookies('上传成功，文件与已提交的相同。'))
+        return response
+
     response.set_cookie(
         key='info', value=encode_cookies('上传成功。'))
 
@@ -338,8 +593,9 @@ async def lock(mission_url: str,
         return invalid
     stu_obj = get_stu_obj(stu_id)
 
-    mission_status = await MissionStatus(student=stu_obj,
-                                         mission=store.missions[mission_url])
+    mission_status = MissionStatus(student=stu_obj,
+                                   mission=store.missions[mission_url],
+                                   index=store.index)
     ext = mission_status.mission.ext
 
     response = RedirectResponse(
@@ -349,9 +605,329 @@ async def lock(mission_url: str,
         mission_path = config.received_path / mission_status.mission.subpath
         ucfp = mission_path / config.get_file_name(stu_obj, ext, False)
         ccfp = mission_path / config.get_file_name(stu_obj, ext)
-        if ucfp.exists():
-            ucfp.rename(mission_path / ccfp)
+        previous = store.index.get(mission_url, stu_obj.stu_id)
+        try:
+            await run_in_threadpool(received_storage.rename, ucfp, ccfp)
+        except FileNotFoundError:
+            pass
+        submission = await run_in_threadpool(store.index.record, 'lock',
+                                             mission_status.mission, stu_obj, previous)
+        await run_in_threadpool(enqueue_check, mission_url, stu_obj.stu_id, submission)
         response.set_cookie(
             key='info', value=encode_cookies('锁定成功。'))
 
     return response
+
+
+def get_api_stu_obj(stu_id: Optional[str] = Depends(get_stu_id)) -> Student:
+    """
+    Get student obj for API endpoints.
+
+    Args:
+        stu_id: student id
+
+    Returns:
+        Student: student obj
+
+    Raises:
+        HTTPException: session is invalid
+    """
+    if not check_stu_id(stu_id):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='请先登录。')
+    return get_stu_obj(stu_id)
+
+
+async def get_api_mission_status(mission_url: str,
+                                 stu_obj: Student = Depends(get_api_stu_obj)) -> MissionStatus:
+    """
+    Get mission status for API endpoints.
+
+    Args:
+        mission_url: the url-name of the mission
+        stu_obj: student obj
+
+    Returns:
+        MissionStatus: the mission status
+
+    Raises:
+        HTTPException: mission is not found
+    """
+    if mission_url not in store.missions:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='任务不存在。')
+    return MissionStatus(student=stu_obj,
+                         mission=store.missions[mission_url],
+                         index=store.index)
+
+
+def get_upload_session(upload_id: str,
+                       mission_status: MissionStatus = Depends(
+                           get_api_mission_status)) -> UploadSession:
+    """
+    Get the resumable upload session of the student.
+
+    Args:
+        upload_id: id of the session
+        mission_status: the mission status
+
+    Returns:
+        UploadSession: the session
+
+    Raises:
+        HTTPException: session is not found
+    """
+    upload = load_session(mission_status.mission, upload_id)
+    if upload is None or upload.stu_id != mission_status.student.stu_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='上传会话不存在。')
+    return upload
+
+
+@app.post('/upload/{mission_url}')
+async def upload_create(filename: str,
+                        size: int = Query(..., gt=0),
+                        mission_status: MissionStatus = Depends(get_api_mission_status)) -> dict:
+    """
+    Create a resumable upload session.
+
+    Args:
+        filename: name of the file to upload
+        size: size of the file to upload, empty files are rejected
+        mission_status: the mission status
+
+    Returns:
+        dict: id, offset and size of the session, and the suggested chunk size
+    """
+    mission = mission_status.mission
+    if not mission_status.avaliable:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='当前任务已无法提交。')
+    if not allowed_file(filename=filename, allowed_extension=mission.ext):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'请上传{mission.ext}格式的文件。')
+    if size > mission.size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'文件超过大小限制({mission.size.human_readable()})。')
+
+    upload = await run_in_threadpool(create_session, mission,
+                                     mission_status.student, filename, size)
+    return {'upload_id': upload.upload_id,
+            'offset': 0,
+            'size': upload.size,
+            'chunk_size': config.UPLOAD_CHUNK_SIZE}
+
+
+@app.get('/upload/{mission_url}/{upload_id}')
+async def upload_offset(mission_status: MissionStatus = Depends(get_api_mission_status),
+                        upload: UploadSession = Depends(get_upload_session)) -> dict:
+    """
+    Query the offset received by a resumable upload session.
+
+    Args:
+        mission_status: the mission status
+        upload: the session
+
+    Returns:
+        dict: id, offset and size of the session
+    """
+    offset = await run_in_threadpool(session_offset, mission_status.mission, upload)
+    return {'upload_id': upload.upload_id, 'offset': offset, 'size': upload.size}
+
+
+@app.put('/upload/{mission_url}/{upload_id}')
+async def upload_chunk(request: Request,
+                       offset: int,
+                       mission_status: MissionStatus = Depends(get_api_mission_status),
+                       upload: UploadSession = Depends(get_upload_session)) -> dict:
+    """
+    Append a chunk, sent as the request body, to a resumable upload session.
+
+    Args:
+        request: request from client
+        offset: offset of the chunk, must be the offset received
+        mission_status: the mission status
+        upload: the session
+
+    Returns:
+        dict: id, offset and size of the session
+    """
+    start = time.perf_counter()
+    received = offset
+    UPLOADS_IN_FLIGHT.inc()
+    try:
+        offset = await write_chunk(mission_status.mission, upload, offset, request.stream())
+    except OffsetMismatch as exception:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail={'offset': exception.args[0]}) from exception
+    except SessionBusy as exception:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail='上传会话正忙。') from exception
+    except FileTooLarge as exception:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail='超出文件大小。') from exception
+    finally:
+        UPLOADS_IN_FLIGHT.dec()
+    UPLOAD_THROUGHPUT.observe((offset - received) / max(time.perf_counter() - start, 1e-6))
+    return {'upload_id': upload.upload_id, 'offset': offset, 'size': upload.size}
+
+
+@app.post('/upload/{mission_url}/{upload_id}/finalize')
+async def upload_finalize(mission_status: MissionStatus = Depends(get_api_mission_status),
+                          upload: UploadSession = Depends(get_upload_session)) -> dict:
+    """
+    Finish a resumable upload session, saving it as the unconfirmed file.
+
+    Args:
+        mission_status: the mission status
+        upload: the session
+
+    Returns:
+        dict: status of the submission
+    """
+    mission = mission_status.mission
+    stu_obj = mission_status.student
+    if not mission_status.avaliable:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='当前任务已无法提交。')
+
+    ucfp = config.received_path / mission.subpath / \
+        config.get_file_name(stu_obj, mission.ext, False)
+    previous = store.index.get(mission.mission_url, stu_obj.stu_id)
+    try:
+        await run_in_threadpool(finalize_session, mission, upload, ucfp)
+    except OffsetMismatch as exception:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail={'offset': exception.args[0]}) from exception
+    submission = await run_in_threadpool(store.index.record, 'upload', mission, stu_obj, previous)
+    UPLOAD_SIZE.observe(upload.size)
+    await run_in_threadpool(enqueue_check, mission.mission_url, stu_obj.stu_id, submission)
+    return {'status': submission.status.value, 'size': int(submission.size)}
+
+
+def check_admin(token: Optional[str] = None,
+                x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Check if the client is an admin.
+    Admin endpoints are disabled unless ADMIN_TOKEN is set.
+
+    Args:
+        token: admin token from query string
+        x_admin_token: admin token from header
+
+    Returns:
+        None
+
+    Raises:
+        HTTPException: client is not an admin
+    """
+    provided = x_admin_token or token
+    if not config.ADMIN_TOKEN or not provided or \
+            not secrets.compare_digest(provided.encode('UTF-8'), config.ADMIN_TOKEN.encode('UTF-8')):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='无权访问。')
+
+
+@app.get('/admin/export/{mission_url}', dependencies=[Depends(check_admin)])
+def admin_export(mission_url: str,
+                 archive: str = 'zip',
+                 locked_only: bool = False) -> StreamingResponse:
+    """
+    Export all submissions of a mission as an archive generated on the fly.
+
+    Args:
+        mission_url: the url-name of the mission
+        archive: 'zip' or 'tar'
+        locked_only: only export locked submissions
+
+    Returns:
+        StreamingResponse: the archive
+    """
+    if mission_url not in store.missions:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='任务不存在。')
+    if archive not in ['zip', 'tar']:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='不支持的格式。')
+
+    mission = store.missions[mission_url]
+    entries = list_entries(mission, dict(store.index.submissions.get(mission_url, {})),
+                           store.students, locked_only)
+    if archive == 'zip':
+        content, media_type = iter_zip(mission, entries), 'application/zip'
+    else:
+        content, media_type = iter_tar(mission, entries), 'application/x-tar'
+    return StreamingResponse(
+        content, media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{mission_url}.{archive}"'})
+
+
+@app.get('/admin/matrix', dependencies=[Depends(check_admin)])
+def admin_matrix(output: str = 'json', rescan: bool = False) -> Response:
+    """
+    Get the status of every student in every mission, read from the index.
+
+    Args:
+        output: 'json' or 'csv'
+        rescan: rescan every mission directory first, with one listing each
+
+    Returns:
+        Response: the matrix, with completion counts of each mission
+    """
+    if output not in ['json', 'csv']:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='不支持的格式。')
+    if rescan:
+        for mission in list(store.missions.values()):
+            store.index.update(mission, store.students)
+
+    missions = store.missions
+    students = store.students
+    submissions = {mission_url: dict(entries)
+                   for mission_url, entries in list(store.index.submissions.items())}
+    if output == 'json':
+        return JSONResponse(build_matrix(missions, submissions, students))
+    return StreamingResponse(
+        iter_matrix_csv(missions, submissions, students), media_type='text/csv; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename="matrix.csv"'})
+
+
+@app.get('/admin/journal/{mission_url}', dependencies=[Depends(check_admin)])
+def admin_journal(mission_url: str, student: Optional[str] = None) -> StreamingResponse:
+    """
+    Get the uploads and locks of a mission recorded in its journal, oldest first.
+
+    Args:
+        mission_url: the url-name of the mission
+        student: only get those of the student id
+
+    Returns:
+        StreamingResponse: the records, in JSON lines
+    """
+    if store.index.journal is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='未启用提交记录。')
+    if mission_url not in store.missions:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='任务不存在。')
+    records = (dump_record(record) for record in store.index.journal.records(mission_url)
+               if student is None or record['student'] == student)
+    return StreamingResponse(records, media_type='application/x-ndjson')
+
+
+@app.get('/admin/jobs', dependencies=[Depends(check_admin)])
+def admin_jobs() -> dict:
+    """
+    Count the checker jobs queued and running.
+
+    Args:
+        None
+
+    Returns:
+        dict: count of jobs by state
+    """
+    return job_queue.depth()
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Expose the metrics of all workers in Prometheus text format.
+
+    Args:
+        None
+
+    Returns:
+        PlainTextResponse: the metrics
+    """
+    return PlainTextResponse(await run_in_threadpool(generate),
+                             media_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,406 @@
+from collections.abc import Callable
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(2 ** power for power in range(10, 33, 2))
+THROUGHPUT_BUCKETS = tuple(2 ** power for power in range(14, 31, 2))
+
+
+class Metric:
+    """
+    The base class of metrics, with values keyed by label values.
+    """
+    kind: str = ''
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        """
+        Initialize the Metric and register it.
+
+        Args:
+            self: the instance
+            name: name of the metric
+            documentation: help of the metric
+            labels: names of the labels
+
+        Returns:
+            Metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def dump(self) -> List[list]:
+        """
+        Dump the values for other processes.
+
+        Args:
+            self: the instance
+
+        Returns:
+            List[list]: label values and value pairs
+        """
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    """
+    The metric only going up, summed across processes.
+    """
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Increase the counter.
+
+        Args:
+            self: the instance
+            labels: values of the labels
+            amount: amount to add
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    The metric going up and down.
+    Summed across live processes, or the maximum one when mode is 'max'.
+    A gauge with a function reads its value when dumped.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 mode: str = 'livesum', function: Optional[Callable[[], float]] = None):
+        """
+        Initialize the Gauge.
+
+        Args:
+            self: the instance
+            name: name of the metric
+            documentation: help of the metric
+            labels: names of the labels
+            mode: 'livesum' or 'max'
+            function: function returning the value
+
+        Returns:
+            Gauge
+        """
+        super().__init__(name, documentation, labels)
+        self.mode = mode
+        self.function = function
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Increase the gauge.
+
+        Args:
+            self: the instance
+            labels: values of the labels
+            amount: amount to add
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """
+        Decrease the gauge.
+
+        Args:
+            self: the instance
+            labels: values of the labels
+            amount: amount to subtract
+
+        Returns:
+            None
+        """
+        self.inc(*labels, amount=-amount)
+
+    def dump(self) -> List[list]:
+        if self.function is not None:
+            try:
+                return [[[], self.function()]]
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.warning('gauge failed: %s %s', self.name, exception)
+                return []
+        return super().dump()
+
+
+class Histogram(Metric):
+    """
+    The metric counting observations in buckets, summed across processes.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Initialize the Histogram.
+
+        Args:
+            self: the instance
+            name: name of the metric
+            documentation: help of the metric
+            labels: names of the labels
+            buckets: upper bounds of the buckets
+
+        Returns:
+            Histogram
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        Record an observation.
+
+        Args:
+            self: the instance
+            value: the observed value
+            labels: values of the labels
+
+        Returns:
+            None
+        """
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # a count for each bucket, then +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def dump(self) -> List[list]:
+        with self.lock:
+            return [[list(key), list(value)] for key, value in self.values.items()]
+
+
+registry: List[Metric] = []
+last_write = 0.0
+
+
+def metrics_file(pid: int) -> Path:
+    """
+    Get the file holding the metrics of a process.
+
+    Args:
+        pid: id of the process
+
+    Returns:
+        Path: the file
+    """
+    return config.metrics_path / f'{pid}.json'
+
+
+def write_metrics(force: bool = False) -> None:
+    """
+    Write the metrics of current process, at most once every METRICS_INTERVAL.
+
+    Args:
+        force: write even if written recently
+
+    Returns:
+        None
+    """
+    global last_write  # pylint: disable=global-statement
+    now = time.monotonic()
+    if not force and now - last_write < config.METRICS_INTERVAL:
+        return
+    last_write = now
+    data = {metric.name: metric.dump() for metric in registry}
+    target = metrics_file(os.getpid())
+    temp_path = target.with_suffix('.part')
+    try:
+        config.metrics_path.mkdir(parents=True, exist_ok=True)
+        temp_path.write_text(json.dumps(data), encoding='UTF-8')
+        os.replace(temp_path, target)
+    except OSError as exception:
+        logger.warning('metrics write failed: %s', exception)
+
+
+def is_alive(pid: int) -> bool:
+    """
+    Check if a process is alive.
+
+    Args:
+        pid: id of the process
+
+    Returns:
+        bool: if the process is alive
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect() -> Dict[str, Dict[Tuple[str, ...], object]]:
+    """
+    Aggregate the metrics written by all processes.
+
+    Args:
+        None
+
+    Returns:
+        Dict[str, Dict[Tuple[str, ...], object]]: values of each metric
+    """
+    write_metrics(force=True)
+    kinds = {metric.name: metric for metric in registry}
+    result = {name: {} for name in kinds}
+    for file_path in config.metrics_path.glob('*.json'):
+        try:
+            data = json.loads(file_path.read_text(encoding='UTF-8'))
+        except (OSError, ValueError):
+            continue
+        alive = is_alive(int(file_path.stem))
+        for name, values in data.items():
+            metric = kinds.get(name)
+            if metric is None:
+                continue
+            merged = result[name]
+            for labels, value in values:
+                key = tuple(labels)
+                if isinstance(metric, Gauge):
+                    if not alive:
+                        continue
+                    if metric.mode == 'max':
+                        merged[key] = max(merged.get(key, value), value)
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+                elif isinstance(metric, Histogram):
+                    previous = merged.get(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(previous, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return result
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """
+    Format labels in Prometheus text format.
+
+    Args:
+        names: names of the labels
+        values: values of the labels
+        extra: extra formatted label
+
+    Returns:
+        str: the formatted labels
+    """
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def generate() -> str:
+    """
+    Generate the metrics of all processes in Prometheus text format.
+
+    Args:
+        None
+
+    Returns:
+        str: the metrics
+    """
+    collected = collect()
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for key, value in sorted(collected[metric.name].items()):
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value):
+                    cumulative += count
+                    bucket = format_labels(metric.labels, key,
+                                           f'le="{"+Inf" if bound == float("inf") else bound}"')
+                    lines.append(f'{metric.name}_bucket{bucket} {cumulative}')
+                labels = format_labels(metric.labels, key)
+                lines.append(f'{metric.name}_count{labels} {cumulative}')
+                lines.append(f'{metric.name}_sum{labels} {value[-1]}')
+            else:
+                lines.append(f'{metric.name}{format_labels(metric.labels, key)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    The ASGI middleware recording the latency of each route.
+    """
+
+    def __init__(self, app):
+        """
+        Initialize the MetricsMiddleware.
+
+        Args:
+            self: the instance
+            app: the ASGI app
+
+        Returns:
+            MetricsMiddleware
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint = scope.get('endpoint')
+            route = getattr(endpoint, '__name__', 'other')
+            REQUEST_LATENCY.observe(time.perf_counter() - start, route)
+            write_metrics()
+
+
+REQUEST_LATENCY = Histogram('collector_request_seconds',
+                            'Latency of requests by route.', ('route',))
+UPLOAD_SIZE = Histogram('collector_upload_bytes',
+                        'Size of uploaded files.', buckets=SIZE_BUCKETS)
+UPLOAD_THROUGHPUT = Histogram('collector_upload_bytes_per_second',
+                              'Throughput of uploads.', buckets=THROUGHPUT_BUCKETS)
+UPLOADS_IN_FLIGHT = Gauge('collector_uploads_in_flight',
+                          'Uploads being received.')
+CHECKER_LATENCY = Histogram('collector_checker_seconds',
+                            'Latency of checkers by mission.', ('mission',))
+INDEX_FS_OPERATIONS = Counter('collector_index_fs_operations_total',
+                              'Filesystem operations of the submission index.', ('operation',))
+INDEX_LOOKUPS = Counter('collector_index_lookups_total',
+                        'Lookups of the submission index by caller.', ('caller',))
+STORE_RELOAD = Histogram('collector_store_reload_seconds',
+                         'Duration of store reloads by kind.', ('kind',))
+ADMISSION_QUEUED = Gauge('collector_admission_queued',
+                         'Uploads waiting to be admitted.')
+ADMISSION_WAIT = Histogram('collector_admission_wait_seconds',
+                           'Time uploads waited to be admitted.')
+ADMISSION_REJECTED = Counter('collector_admission_rejected_total',
+                             'Uploads rejected by admission control by reason.', ('reason',))
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Optional
+import hashlib
+import json
+import threading
+
+from fastapi import Request, Response, status
+
+from assets import static_assets
+from store import Mission, MissionStatus, Submission
+import config
+
+
+def hash_templates(directory: Path) -> str:
+    """
+    Hash the templates, so pages change their versions when templates change.
+
+    Args:
+        directory: directory of the templates
+
+    Returns:
+        str: the hash
+    """
+    digest = hashlib.sha256()
+    for template in sorted(directory.glob('**/*.html')):
+        digest.update(template.read_bytes())
+    return digest.hexdigest()
+
+
+TEMPLATES_VERSION = hash_templates(Path('templates'))
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Make an ETag from the parts a page is rendered from.
+    It changes with the templates and the static files they link to.
+
+    Args:
+        parts: json serializable parts
+
+    Returns:
+        str: the ETag
+    """
+    content = json.dumps([TEMPLATES_VERSION, static_assets.version, parts],
+                         default=str, ensure_ascii=False)
+    return f'"{hashlib.sha256(content.encode("UTF-8")).hexdigest()[:32]}"'
+
+
+def mission_version(mission: Mission) -> list:
+    """
+    Get the parts of a mission shown on pages.
+
+    Args:
+        mission: the mission
+
+    Returns:
+        list: the parts
+    """
+    return [mission.mission_url, mission.name, mission.description,
+            mission.deadline, mission.ext, int(mission.size)]
+
+
+def submission_version(submission: Optional[Submission]) -> Optional[list]:
+    """
+    Get the parts of a submission shown on pages.
+
+    Args:
+        submission: the submission
+
+    Returns:
+        Optional[list]: the parts
+    """
+    if submission is None:
+        return None
+    return [submission.status.value, int(submission.size),
+            submission.mtime_ns, submission.sha256]
+
+
+def row_version(mission_status: MissionStatus) -> list:
+    """
+    Get the parts of a row of the missions page.
+
+    Args:
+        mission_status: the mission status
+
+    Returns:
+        list: the parts
+    """
+    return [mission_status.student.stu_id,
+            mission_version(mission_status.mission),
+            submission_version(mission_status.index.get(mission_status.mission.mission_url,
+                                                        mission_status.student.stu_id)),
+            bool(mission_status.avaliable),
+            mission_status.finish_rate]
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Check if the client has the page of etag already.
+
+    Args:
+        request: request from client
+        etag: ETag of the page
+
+    Returns:
+        bool: if the page is not modified
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in tags or '*' in tags
+
+
+def cache_headers(etag: str) -> dict:
+    """
+    Get headers letting the client revalidate a page by its ETag.
+
+    Args:
+        etag: ETag of the page
+
+    Returns:
+        dict: the headers
+    """
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Answer a client which has the page already.
+
+    Args:
+        etag: ETag of the page
+
+    Returns:
+        Response: the 304 response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
+
+class FragmentCache:
+    """
+    The LRU cache of rendered pages and fragments, keyed by their ETags.
+    """
+    capacity: int
+    fragments: 'OrderedDict[str, str]'
+
+    def __init__(self, capacity: int):
+        """
+        Initialize the FragmentCache.
+
+        Args:
+            self: the instance
+            capacity: count of fragments kept
+
+        Returns:
+            FragmentCache
+        """
+        self.capacity = capacity
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> str:
+        """
+        Get a fragment, rendering it on a cache miss.
+
+        Args:
+            self: the instance
+            key: the key of the fragment
+            render: function rendering the fragment
+
+        Returns:
+            str: the fragment
+        """
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                return fragment
+        fragment = render()
+        with self.lock:
+            self.fragments[key] = fragment
+            while len(self.fragments) > self.capacity:
+                self.fragments.popitem(last=False)
+        return fragment
+
+
+fragment_cache = FragmentCache(config.FRAGMENT_CACHE_SIZE)
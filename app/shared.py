@@ -0,0 +1,172 @@
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import logging
+import multiprocessing
+import os
+import pickle
+import zlib
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Bytes of each changed file name remembered, longer ones make workers rescan buckets
+CHANGE_WIDTH = 256
+
+
+class SharedState:
+    """
+    The state shared by the gunicorn master and its forked workers.
+    Must be created before the workers are forked (preload_app).
+
+    The master watches local storage, writes a snapshot of the parsed data
+    and bumps the generation; workers load the snapshot when the generation
+    they have seen is outdated. Changes of received files are appended to
+    a ring of the last SHARED_CHANGES file names, so workers refresh only
+    those files; workers which fell behind the ring rescan the mission
+    directories of the buckets whose counters were bumped.
+    """
+    owner: int
+    generation: Any
+    buckets: Any
+    sequence: Any
+    changes: Any
+    snapshot_path: Path
+
+    def __init__(self):
+        """
+        Initialize the SharedState.
+
+        Args:
+            self: the instance
+
+        Returns:
+            SharedState
+        """
+        self.owner = os.getpid()
+        self.generation = multiprocessing.Value('Q', 0)
+        self.buckets = multiprocessing.Array('Q', config.SHARED_BUCKETS)
+        self.sequence = multiprocessing.Value('Q', 0)
+        self.changes = multiprocessing.Array('c', config.SHARED_CHANGES * CHANGE_WIDTH,
+                                             lock=False)
+        self.snapshot_path = config.shared_path / \
+            f'collector-{self.owner}.pickle'
+
+    @property
+    def is_worker(self) -> bool:
+        """
+        (Read-only)
+        If current process is a forked worker.
+
+        Args:
+            self: the instance
+
+        Returns:
+            Bool
+        """
+        return os.getpid() != self.owner
+
+    def bucket_of(self, subpath: str) -> int:
+        """
+        Get the bucket of a mission directory.
+
+        Args:
+            self: the instance
+            subpath: subpath of the mission
+
+        Returns:
+            int: the bucket
+        """
+        return zlib.crc32(Path(subpath).as_posix().encode('UTF-8')) % len(self.buckets)
+
+    def publish(self, data: dict) -> None:
+        """
+        Write a snapshot of the data and notify the workers.
+
+        Args:
+            self: the instance
+            data: the data to share
+
+        Returns:
+            None
+        """
+        temp_path = self.snapshot_path.with_suffix('.part')
+        temp_path.write_bytes(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        os.replace(temp_path, self.snapshot_path)
+        with self.generation.get_lock():
+            self.generation.value += 1
+        logger.info('PUBLISH_SNAPSHOT %s', self.generation.value)
+
+    def load(self) -> dict:
+        """
+        Read the latest snapshot.
+
+        Args:
+            self: the instance
+
+        Returns:
+            dict: the shared data
+        """
+        return pickle.loads(self.snapshot_path.read_bytes())
+
+    def touch(self, subpath: str, name: str) -> None:
+        """
+        Notify the workers that a received file has changed.
+
+        Args:
+            self: the instance
+            subpath: subpath of the mission
+            name: name of the file
+
+        Returns:
+            None
+        """
+        bucket = self.bucket_of(subpath)
+        with self.buckets.get_lock():
+            self.buckets[bucket] += 1
+        change = (Path(subpath) / name).as_posix().encode('UTF-8')
+        if len(change) > CHANGE_WIDTH:
+            # too long to remember, workers rescan its bucket
+            change = b''
+        with self.sequence.get_lock():
+            offset = self.sequence.value % config.SHARED_CHANGES * CHANGE_WIDTH
+            self.changes[offset:offset + CHANGE_WIDTH] = change.ljust(CHANGE_WIDTH, b'\0')
+            self.sequence.value += 1
+
+    def read_changes(self, sequence: int) -> Tuple[int, Optional[List[str]]]:
+        """
+        Read the received files changed since a sequence number.
+
+        Args:
+            self: the instance
+            sequence: sequence number of the last change seen
+
+        Returns:
+            Tuple[int, Optional[List[str]]]: the current sequence number, and the
+                paths of the changed files relative to received; None if some
+                were not remembered
+        """
+        with self.sequence.get_lock():
+            current = self.sequence.value
+            if current - sequence > config.SHARED_CHANGES:
+                return current, None
+            changes = []
+            for number in range(sequence, current):
+                offset = number % config.SHARED_CHANGES * CHANGE_WIDTH
+                change = self.changes[offset:offset + CHANGE_WIDTH].rstrip(b'\0')
+                if not change:
+                    return current, None
+                changes.append(change.decode('UTF-8'))
+        return current, changes
+
+    def read_buckets(self) -> List[int]:
+        """
+        Read the counters of all buckets.
+
+        Args:
+            self: the instance
+
+        Returns:
+            List[int]: the counters
+        """
+        return self.buckets[:]
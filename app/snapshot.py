@@ -0,0 +1,160 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import time
+import uuid
+
+from pydantic import VERSION as PYDANTIC_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the content of the snapshot changes
+SNAPSHOT_VERSION = 1
+# Modules defining, parsing or naming what the snapshot holds; a change
+# of any of them, as in a new image, invalidates the snapshot
+SNAPSHOT_SOURCES = ['config.py', 'snapshot.py', 'storage.py', 'store.py']
+# Files changed in the last seconds may change again within the same
+# mtime tick, unseen; they are never trusted
+RACY_SECONDS = 2
+
+Stamp = Tuple[int, int]
+
+
+def source_version() -> bytes:
+    """
+    Get the version of the snapshot, from SNAPSHOT_VERSION, the sources
+    in SNAPSHOT_SOURCES and the version of pydantic pickling the missions.
+
+    Args:
+        None
+
+    Returns:
+        bytes: the version, a line without newline
+    """
+    digest = hashlib.sha256(f'{SNAPSHOT_VERSION}:{PYDANTIC_VERSION}'.encode('UTF-8'))
+    for name in SNAPSHOT_SOURCES:
+        digest.update((Path(__file__).parent / name).read_bytes())
+    return digest.hexdigest().encode('ascii')
+
+
+def stamp_of(path: Path, settled: bool = True) -> Optional[Stamp]:
+    """
+    Get the modification time and size of a file or directory,
+    which a snapshot is validated against.
+
+    Args:
+        path: path of the file
+        settled: if a file changed too recently has no stamp
+
+    Returns:
+        Optional[Stamp]: mtime in ns and size, None if not found or changed too recently
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    if settled and time.time_ns() - stat.st_mtime_ns < RACY_SECONDS * 1e9:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def paused_gc() -> Iterator[None]:
+    """
+    Pause the garbage collector while many objects are built,
+    none of which is garbage.
+
+    Args:
+        None
+
+    Returns:
+        Iterator[None]: the context
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StoreSnapshot:
+    """
+    The snapshot of the parsed students, missions, checker hashes and
+    submission index, written after they are read so the next start
+    only reads again what has changed since. It starts with the version
+    of the code writing it, and is ignored by any other.
+    """
+    path: Path
+    version: bytes
+
+    def __init__(self, path: Path):
+        """
+        Initialize the StoreSnapshot.
+
+        Args:
+            self: the instance
+            path: path of the snapshot
+
+        Returns:
+            StoreSnapshot
+        """
+        self.path = path
+        # of the code running, not of the files as they may be changed later
+        self.version = source_version()
+
+    def load(self) -> dict:
+        """
+        Read the snapshot.
+
+        Args:
+            self: the instance
+
+        Returns:
+            dict: the data, empty if there is no valid snapshot
+        """
+        try:
+            content = self.path.read_bytes()
+        except FileNotFoundError:
+            return {}
+        version, _, content = content.partition(b'\n')
+        if version != self.version:
+            # written by other code, its objects are not even unpickled
+            logger.info('snapshot outdated: %s', self.path)
+            return {}
+        try:
+            data = pickle.loads(content)
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('snapshot invalid: %s', exception)
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+    def save(self, data: dict) -> None:
+        """
+        Write the snapshot, replacing the previous one at once.
+
+        Args:
+            self: the instance
+            data: the data
+
+        Returns:
+            None
+        """
+        temp_path = self.path.parent / f'.{uuid.uuid4().hex}.part'
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(self.version + b'\n' +
+                                  pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            os.replace(temp_path, self.path)
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('snapshot not saved: %s', exception)
+            temp_path.unlink(missing_ok=True)
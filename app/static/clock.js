@@ -0,0 +1,34 @@
+// Fill in the time-dependent parts of a page, so the HTML itself can be cached.
+(function () {
+    const weekdays = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'];
+    const pad = (value) => String(value).padStart(2, '0');
+
+    function formatNow(date) {
+        return `${weekdays[date.getDay()]} ${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+            `${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`;
+    }
+
+    function formatRemain(milliseconds) {
+        const total = Math.floor(milliseconds / 1000);
+        const days = Math.floor(total / 86400);
+        const rest = total - days * 86400;
+        const time = `${Math.floor(rest / 3600)}:${pad(Math.floor(rest % 3600 / 60))}:${pad(rest % 60)}`;
+        if (!days) {
+            return time;
+        }
+        return `${days} day${Math.abs(days) === 1 ? '' : 's'}, ${time}`;
+    }
+
+    function update() {
+        const now = new Date();
+        document.querySelectorAll('[data-now]').forEach((element) => {
+            element.textContent = formatNow(now);
+        });
+        document.querySelectorAll('[data-deadline]').forEach((element) => {
+            element.textContent = formatRemain(Number(element.dataset.deadline) - now.getTime());
+        });
+    }
+
+    update();
+    setInterval(update, 1000);
+})();
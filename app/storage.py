@@ -0,0 +1,773 @@
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Tuple
+import hashlib
+import logging
+import os
+import tempfile
+import urllib.parse
+import uuid
+
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+
+from metrics import INDEX_FS_OPERATIONS
+import config
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+# Size of each part of a multipart upload to s3, at least 5MiB
+S3_PART_SIZE = 8 * 1024 * 1024
+
+
+class FileTooLarge(Exception):
+    """
+    The exception raised when an upload exceeds the size of its mission.
+    """
+
+
+class SavedFile(NamedTuple):
+    """
+    The class defines a file saved from an upload.
+    """
+    size: int
+    sha256: str
+    changed: bool
+
+
+class StoredFile(NamedTuple):
+    """
+    The class defines a received file in the storage.
+    """
+    path: Path
+    size: int
+    mtime_ns: int
+    sha256: Optional[str]
+
+    @property
+    def mtime(self) -> datetime:
+        """
+        (Read-only)
+        Modification time of the file.
+
+        Args:
+            self: the instance
+
+        Returns:
+            datetime
+        """
+        return datetime.fromtimestamp(self.mtime_ns / 1e9)
+
+
+def read_file_hash(file_path: Path) -> Optional[str]:
+    """
+    Read the hash recorded on a file when it was saved.
+
+    Args:
+        file_path: path of the file
+
+    Returns:
+        Optional[str]: the sha256 hex digest, None if not recorded
+    """
+    try:
+        return os.getxattr(file_path, config.HASH_XATTR).decode('ascii')
+    except (OSError, AttributeError):
+        return None
+
+
+def hash_file(file_path: Path) -> str:
+    """
+    Compute the hash of a file.
+
+    Args:
+        file_path: path of the file
+
+    Returns:
+        str: the sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(config.UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_file(file_path: Path, sha256: str, target: Path) -> bool:
+    """
+    Move a received file to target, recording its hash on it.
+    The file is dropped when target has the same content already.
+    Each saved file keeps its own inode, so its modification time is
+    the time it was received, even if another student sent the same bytes.
+
+    Args:
+        file_path: path of the received file
+        sha256: hash of the received file
+        target: path of the saved file
+
+    Returns:
+        bool: if target was changed
+    """
+    if read_file_hash(target) == sha256:
+        file_path.unlink()
+        return False
+    try:
+        os.setxattr(file_path, config.HASH_XATTR, sha256.encode('ascii'))
+    except (OSError, AttributeError) as exception:
+        logger.warning('hash not recorded: %s', exception)
+    os.replace(file_path, target)
+    return True
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Get the Content-Disposition header of a download, the name may not be ASCII.
+
+    Args:
+        filename: name of the file downloaded
+
+    Returns:
+        str: the header
+    """
+    return f"attachment; filename*=utf-8''{urllib.parse.quote(filename)}"
+
+
+class Storage:
+    """
+    The base class of storages of received files.
+    Files are named by their paths under received_path on every storage,
+    so the index, the checker cache and the jobs do not depend on it.
+    Names starting with a dot are temp files, never listed.
+    """
+    # if changes are reported to the store by watching received_path
+    watched: bool = True
+
+    def list(self, directory: Path) -> Iterator[StoredFile]:
+        """
+        List the files in a directory.
+
+        Args:
+            self: the instance
+            directory: path of the directory
+
+        Returns:
+            Iterator[StoredFile]: the files
+        """
+        raise NotImplementedError
+
+    def stat(self, path: Path) -> Optional[StoredFile]:
+        """
+        Get the size, modification time and hash of a file.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Optional[StoredFile]: the file, None if not found
+        """
+        raise NotImplementedError
+
+    async def save(self, chunks: AsyncIterator[bytes], target: Path,
+                   max_size: int) -> SavedFile:
+        """
+        Stream an upload to target, hashing it.
+        Target is replaced only when the whole file has been received.
+
+        Args:
+            self: the instance
+            chunks: content of the upload
+            target: path of the saved file
+            max_size: maximum size allowed, in bytes
+
+        Returns:
+            SavedFile: size and hash of the file, and if target was changed
+
+        Raises:
+            FileTooLarge: the file is larger than max_size
+        """
+        raise NotImplementedError
+
+    def save_file(self, file_path: Path, target: Path) -> bool:
+        """
+        Move a file received on local storage to target.
+
+        Args:
+            self: the instance
+            file_path: path of the received file
+            target: path of the saved file
+
+        Returns:
+            bool: if target was changed
+        """
+        raise NotImplementedError
+
+    def rename(self, source: Path, target: Path) -> None:
+        """
+        Rename a file, replacing target.
+
+        Args:
+            self: the instance
+            source: path of the file
+            target: new path of the file
+
+        Returns:
+            None
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        raise NotImplementedError
+
+    def open(self, path: Path) -> Tuple[BinaryIO, StoredFile]:
+        """
+        Open a file for reading.
+        The size and time returned are those of the opened content.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Tuple[BinaryIO, StoredFile]: the opened file, to be closed by the caller,
+                and its size, time and hash
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        raise NotImplementedError
+
+    def fetch(self, path: Path) -> Path:
+        """
+        Get a copy of a file on local storage, for checkers.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Path: path of the copy
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        raise NotImplementedError
+
+    def discard(self, path: Path, local_path: Path) -> None:
+        """
+        Remove a copy made by fetch.
+
+        Args:
+            self: the instance
+            path: path of the file
+            local_path: path of the copy
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def link(self, path: Path, filename: str) -> Optional[str]:
+        """
+        Get a url the client downloads a file from directly.
+
+        Args:
+            self: the instance
+            path: path of the file
+            filename: name of the file downloaded
+
+        Returns:
+            Optional[str]: the url, None if the file is served by the app
+        """
+        return None
+
+
+class LocalStorage(Storage):
+    """
+    The storage of received files on local disk, or a volume shared by the nodes.
+    A file is not written again when it has the content of the saved one.
+    """
+
+    def list(self, directory: Path) -> Iterator[StoredFile]:
+        """
+        List the files in a directory, in one scandir.
+
+        Args:
+            self: the instance
+            directory: path of the directory
+
+        Returns:
+            Iterator[StoredFile]: the files
+        """
+        if not directory.is_dir():
+            return
+        INDEX_FS_OPERATIONS.inc('scandir')
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                INDEX_FS_OPERATIONS.inc('stat')
+                INDEX_FS_OPERATIONS.inc('getxattr')
+                yield StoredFile(Path(entry.path), stat.st_size, stat.st_mtime_ns,
+                                 read_file_hash(entry.path))
+
+    def stat(self, path: Path) -> Optional[StoredFile]:
+        """
+        Get the size, modification time and hash of a file.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Optional[StoredFile]: the file, None if not found
+        """
+        try:
+            INDEX_FS_OPERATIONS.inc('stat')
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        INDEX_FS_OPERATIONS.inc('getxattr')
+        return StoredFile(path, stat.st_size, stat.st_mtime_ns, read_file_hash(path))
+
+    async def save(self, chunks: AsyncIterator[bytes], target: Path,
+                   max_size: int) -> SavedFile:
+        """
+        Stream an upload to a temp file next to target, which is moved to
+        target only when the whole file has been received.
+
+        Args:
+            self: the instance
+            chunks: content of the upload
+            target: path of the saved file
+            max_size: maximum size allowed, in bytes
+
+        Returns:
+            SavedFile: size and hash of the file, and if target was changed
+
+        Raises:
+            FileTooLarge: the file is larger than max_size
+        """
+        temp_path = target.parent / f'.{target.name}.{uuid.uuid4().hex}.part'
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, 'wb') as temp:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLarge(size)
+                    digest.update(chunk)
+                    await temp.write(chunk)
+            changed = await run_in_threadpool(store_file, temp_path, digest.hexdigest(), target)
+        finally:
+            if temp_path.exists():
+                await run_in_threadpool(temp_path.unlink)
+        return SavedFile(size, digest.hexdigest(), changed)
+
+    def save_file(self, file_path: Path, target: Path) -> bool:
+        """
+        Move a file received on local storage to target.
+
+        Args:
+            self: the instance
+            file_path: path of the received file
+            target: path of the saved file
+
+        Returns:
+            bool: if target was changed
+        """
+        return store_file(file_path, hash_file(file_path), target)
+
+    def rename(self, source: Path, target: Path) -> None:
+        """
+        Rename a file, replacing target.
+
+        Args:
+            self: the instance
+            source: path of the file
+            target: new path of the file
+
+        Returns:
+            None
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        os.replace(source, target)
+
+    def open(self, path: Path) -> Tuple[BinaryIO, StoredFile]:
+        """
+        Open a file for reading.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Tuple[BinaryIO, StoredFile]: the opened file and its size, time and hash
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        file = open(path, 'rb')  # pylint: disable=consider-using-with
+        stat = os.fstat(file.fileno())
+        return file, StoredFile(path, stat.st_size, stat.st_mtime_ns, None)
+
+    def fetch(self, path: Path) -> Path:
+        """
+        Get the file itself, it is on local storage already.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Path: path of the file
+        """
+        return path
+
+    def discard(self, path: Path, local_path: Path) -> None:
+        """
+        Do nothing, the file itself was fetched.
+
+        Args:
+            self: the instance
+            path: path of the file
+            local_path: path of the file
+
+        Returns:
+            None
+        """
+
+
+class S3Storage(Storage):
+    """
+    The storage of received files in an S3-compatible bucket, shared by the nodes.
+    A file is stored under the key of its path relative to received_path,
+    with its hash in the sha256 metadata.
+    Files saved by other nodes are not watched, the index is rescanned
+    every STORAGE_RESCAN_INTERVAL seconds instead.
+    """
+    watched = False
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = ''):
+        """
+        Initialize the S3Storage.
+        Credentials and region are read by boto3 from the environment.
+
+        Args:
+            self: the instance
+            bucket: name of the bucket
+            prefix: prefix of the keys
+            endpoint_url: url of an S3-compatible service, empty for AWS
+
+        Returns:
+            S3Storage
+        """
+        if boto3 is None:
+            raise RuntimeError('STORAGE_BACKEND=s3 needs boto3 installed')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None)
+
+    def key(self, path: Path) -> str:
+        """
+        Get the key of a file.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            str: the key
+        """
+        return self.prefix + path.relative_to(config.received_path).as_posix()
+
+    @staticmethod
+    def is_not_found(exception: Exception) -> bool:
+        """
+        Check if a request failed because the key is not found.
+
+        Args:
+            exception: the exception raised by the request
+
+        Returns:
+            bool: if the key is not found
+        """
+        return isinstance(exception, ClientError) and \
+            exception.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']
+
+    def list(self, directory: Path) -> Iterator[StoredFile]:
+        """
+        List the files in a directory, with one request per thousand files.
+        Hashes are not listed by S3, they are left empty.
+
+        Args:
+            self: the instance
+            directory: path of the directory
+
+        Returns:
+            Iterator[StoredFile]: the files
+        """
+        prefix = f'{self.key(directory)}/'
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            INDEX_FS_OPERATIONS.inc('list')
+            for item in page.get('Contents', []):
+                name = item['Key'][len(prefix):]
+                if name.startswith('.'):
+                    continue
+                yield StoredFile(directory / name, item['Size'],
+                                 int(item['LastModified'].timestamp() * 1e9), None)
+
+    def stat(self, path: Path) -> Optional[StoredFile]:
+        """
+        Get the size, modification time and hash of a file.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Optional[StoredFile]: the file, None if not found
+        """
+        try:
+            INDEX_FS_OPERATIONS.inc('head')
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+        except Exception as exception:  # pylint: disable=broad-except
+            if self.is_not_found(exception):
+                return None
+            raise
+        return StoredFile(path, head['ContentLength'],
+                          int(head['LastModified'].timestamp() * 1e9),
+                          head.get('Metadata', {}).get('sha256'))
+
+    async def save(self, chunks: AsyncIterator[bytes], target: Path,
+                   max_size: int) -> SavedFile:
+        """
+        Stream an upload to target, in parts of S3_PART_SIZE.
+        A file smaller than one part is put at once; a larger one is put by
+        a multipart upload, which is only visible when completed.
+
+        Args:
+            self: the instance
+            chunks: content of the upload
+            target: path of the saved file
+            max_size: maximum size allowed, in bytes
+
+        Returns:
+            SavedFile: size and hash of the file, and if target was changed
+
+        Raises:
+            FileTooLarge: the file is larger than max_size
+        """
+        key = self.key(target)
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        parts = []
+        upload_id = None
+        completed = False
+
+        async def upload_part() -> None:
+            part = await run_in_threadpool(self.client.upload_part, Bucket=self.bucket,
+                                           Key=key, UploadId=upload_id,
+                                           PartNumber=len(parts) + 1, Body=bytes(buffer))
+            parts.append({'ETag': part['ETag'], 'PartNumber': len(parts) + 1})
+            buffer.clear()
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLarge(size)
+                digest.update(chunk)
+                buffer += chunk
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        upload_id = (await run_in_threadpool(
+                            self.client.create_multipart_upload,
+                            Bucket=self.bucket, Key=key))['UploadId']
+                    await upload_part()
+
+            sha256 = digest.hexdigest()
+            previous = await run_in_threadpool(self.stat, target)
+            if previous and previous.sha256 == sha256:
+                return SavedFile(size, sha256, False)
+
+            if upload_id is None:
+                await run_in_threadpool(self.client.put_object, Bucket=self.bucket, Key=key,
+                                        Body=bytes(buffer), Metadata={'sha256': sha256})
+                return SavedFile(size, sha256, True)
+
+            if buffer:
+                await upload_part()
+            await run_in_threadpool(self.client.complete_multipart_upload,
+                                    Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                    MultipartUpload={'Parts': parts})
+            completed = True
+            # the hash is only known at the end, it is set by copying the file onto itself
+            await run_in_threadpool(self.client.copy_object, Bucket=self.bucket, Key=key,
+                                    CopySource={'Bucket': self.bucket, 'Key': key},
+                                    Metadata={'sha256': sha256}, MetadataDirective='REPLACE')
+            return SavedFile(size, sha256, True)
+        finally:
+            if upload_id is not None and not completed:
+                await run_in_threadpool(self.client.abort_multipart_upload,
+                                        Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def save_file(self, file_path: Path, target: Path) -> bool:
+        """
+        Upload a file received on local storage to target, then remove it.
+
+        Args:
+            self: the instance
+            file_path: path of the received file
+            target: path of the saved file
+
+        Returns:
+            bool: if target was changed
+        """
+        sha256 = hash_file(file_path)
+        previous = self.stat(target)
+        changed = not previous or previous.sha256 != sha256
+        if changed:
+            self.client.upload_file(str(file_path), self.bucket, self.key(target),
+                                    ExtraArgs={'Metadata': {'sha256': sha256}})
+        file_path.unlink()
+        return changed
+
+    def rename(self, source: Path, target: Path) -> None:
+        """
+        Rename a file, by copying it to target then deleting it.
+
+        Args:
+            self: the instance
+            source: path of the file
+            target: new path of the file
+
+        Returns:
+            None
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        try:
+            self.client.copy_object(Bucket=self.bucket, Key=self.key(target),
+                                    CopySource={'Bucket': self.bucket, 'Key': self.key(source)})
+        except Exception as exception:  # pylint: disable=broad-except
+            if self.is_not_found(exception):
+                raise FileNotFoundError(source) from exception
+            raise
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(source))
+
+    def open(self, path: Path) -> Tuple[BinaryIO, StoredFile]:
+        """
+        Open a file for reading, streamed from the bucket.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Tuple[BinaryIO, StoredFile]: the opened file and its size, time and hash
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.key(path))
+        except Exception as exception:  # pylint: disable=broad-except
+            if self.is_not_found(exception):
+                raise FileNotFoundError(path) from exception
+            raise
+        return obj['Body'], StoredFile(path, obj['ContentLength'],
+                                       int(obj['LastModified'].timestamp() * 1e9),
+                                       obj.get('Metadata', {}).get('sha256'))
+
+    def link(self, path: Path, filename: str) -> Optional[str]:
+        """
+        Get a presigned url of a file, valid for S3_LINK_EXPIRES seconds.
+        Ranges and ETags are answered by the bucket.
+
+        Args:
+            self: the instance
+            path: path of the file
+            filename: name of the file downloaded
+
+        Returns:
+            Optional[str]: the url
+        """
+        return self.client.generate_presigned_url(
+            'get_object', ExpiresIn=config.S3_LINK_EXPIRES,
+            Params={'Bucket': self.bucket, 'Key': self.key(path),
+                    'ResponseContentDisposition': content_disposition(filename)})
+
+    def fetch(self, path: Path) -> Path:
+        """
+        Download a file to a temp file, keeping its extension for checkers.
+
+        Args:
+            self: the instance
+            path: path of the file
+
+        Returns:
+            Path: path of the temp file
+
+        Raises:
+            FileNotFoundError: the file is not found
+        """
+        descriptor, local_path = tempfile.mkstemp(prefix='collector-', suffix=path.suffix)
+        os.close(descriptor)
+        try:
+            self.client.download_file(self.bucket, self.key(path), local_path)
+        except Exception as exception:  # pylint: disable=broad-except
+            os.unlink(local_path)
+            if self.is_not_found(exception):
+                raise FileNotFoundError(path) from exception
+            raise
+        return Path(local_path)
+
+    def discard(self, path: Path, local_path: Path) -> None:
+        """
+        Remove a temp file made by fetch.
+
+        Args:
+            self: the instance
+            path: path of the file
+            local_path: path of the temp file
+
+        Returns:
+            None
+        """
+        local_path.unlink(missing_ok=True)
+
+
+def create_storage() -> Storage:
+    """
+    Create the storage of received files chosen by STORAGE_BACKEND.
+
+    Args:
+        None
+
+    Returns:
+        Storage: the storage
+    """
+    if config.STORAGE_BACKEND == 's3':
+        logger.info('STORAGE s3://%s/%s', config.S3_BUCKET, config.S3_PREFIX)
+        return S3Storage(config.S3_BUCKET, config.S3_PREFIX, config.S3_ENDPOINT_URL)
+    return LocalStorage()
+
+
+received_storage = create_storage()
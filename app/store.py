@@ -1,21 +1,30 @@
-from collections.abc import Callable
 from datetime import datetime, timedelta
 from enum import Enum
-from importlib import import_module, invalidate_caches
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
 
-from async_property import AwaitLoader, async_cached_property
 from pydantic import BaseModel, ByteSize
-from watchdog.events import FileSystemEventHandler, EVENT_TYPE_CREATED
+from watchdog.events import FileSystemEventHandler, EVENT_TYPE_CREATED, \
+    EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
 from watchdog.observers import Observer
 
+from journal import STATE_OP, SubmissionJournal
+from metrics import INDEX_LOOKUPS, STORE_RELOAD
+from shared import SharedState
+from snapshot import RACY_SECONDS, Stamp, StoreSnapshot, paused_gc, stamp_of
+from storage import received_storage
 import config
 
 logger = logging.getLogger(__name__)
 
+CHANGE_EVENT_TYPES = [EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED, EVENT_TYPE_DELETED]
+
 class StatusEnum(str, Enum):
     """
     The class defines the enum of submission status.
@@ -25,13 +34,33 @@ class StatusEnum(str, Enum):
     EMPTY = '未提交'
 
 
-class Student(BaseModel):
+class Student:
     """
     The class defines a student.
+    Students are built once by the store and shared by requests.
     """
+    __slots__ = ('stu_id', 'name')
     stu_id: str
     name: str
 
+    def __init__(self, stu_id: str, name: str):
+        """
+        Initialize the Student.
+
+        Args:
+            self: the instance
+            stu_id: student id
+            name: name of the student
+
+        Returns:
+            Student
+        """
+        self.stu_id = stu_id
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'Student(stu_id={self.stu_id!r}, name={self.name!r})'
+
 
 class Mission(BaseModel):
     """
@@ -46,66 +75,534 @@ class Mission(BaseModel):
     subpath: str
 
 
-class UserFileInfo(AwaitLoader):
+class Submission:
     """
-    The class defines info of user file.
+    The class defines a submitted file in the index.
+    The path and time are built on first use, so an index loaded from
+    a snapshot does not build them for every file.
     """
-    student: Student
-    mission: Mission
-    status: StatusEnum = StatusEnum.EMPTY
-    sub_file_path: Optional[Path] = None
-    sub_size: Optional[ByteSize] = None
-    sub_time: Optional[datetime] = None
+    __slots__ = ('status', 'raw_path', 'size', 'mtime_ns', 'sha256')
+    status: StatusEnum
+    raw_path: Union[str, Path]
+    size: int
+    mtime_ns: int
+    sha256: Optional[str]
+
+    def __init__(self, status: StatusEnum, path: Union[str, Path], size: int,
+                 mtime_ns: int, sha256: Optional[str] = None):
+        """
+        Initialize the Submission.
+
+        Args:
+            self: the instance
+            status: status of the file
+            path: path of the file
+            size: size of the file
+            mtime_ns: modification time of the file, in ns
+            sha256: hash of the file, None if unknown
+
+        Returns:
+            Submission
+        """
+        self.status = status
+        self.raw_path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
 
-    def __init__(self, mission: Mission, student: Student):
+    def __repr__(self) -> str:
+        return f'Submission(status={self.status!r}, path={str(self.raw_path)!r}, ' \
+            f'size={self.size!r}, mtime_ns={self.mtime_ns!r})'
+
+    @property
+    def path(self) -> Path:
         """
-        Initialize the UserFileInfo.
+        (Read-only)
+        Path of the file.
 
         Args:
             self: the instance
 
         Returns:
-            UserFileInfo
+            Path
         """
-        self.mission = mission
-        self.student = student
-        AwaitLoader.__init__(self)
+        if not isinstance(self.raw_path, Path):
+            self.raw_path = Path(self.raw_path)
+        return self.raw_path
+
+    @property
+    def mtime(self) -> datetime:
+        """
+        (Read-only)
+        Modification time of the file.
+
+        Args:
+            self: the instance
+
+        Returns:
+            datetime
+        """
+        return datetime.fromtimestamp(self.mtime_ns / 1e9)
+
+    def to_row(self) -> tuple:
+        """
+        Get the plain values of the submission, for the snapshot.
+
+        Args:
+            self: the instance
+
+        Returns:
+            tuple: name of the status, file name, size, modification time and hash
+        """
+        return self.status.name, os.path.basename(self.raw_path), self.size, \
+            self.mtime_ns, self.sha256
+
+    @classmethod
+    def from_record(cls, record: dict, directory: str) -> 'Submission':
+        """
+        Build a submission from the record of its change in the journal.
+
+        Args:
+            record: the record
+            directory: path of the directory of the file
+
+        Returns:
+            Submission
+        """
+        return cls.from_row((record['new'], record['file'], record['size'],
+                             record['mtime_ns'], record['sha256']), directory)
+
+    def to_record(self) -> dict:
+        """
+        Get the values of the submission in a record of the journal.
+
+        Args:
+            self: the instance
+
+        Returns:
+            dict: name of the status, file name, size, modification time and hash
+        """
+        return dict(zip(['new', 'file', 'size', 'mtime_ns', 'sha256'], self.to_row()))
+
+    @classmethod
+    def from_row(cls, row: tuple, directory: str) -> 'Submission':
+        """
+        Build a submission from the values of to_row.
+
+        Args:
+            row: the values
+            directory: path of the directory of the file
+
+        Returns:
+            Submission
+        """
+        status, name, size, mtime_ns, sha256 = row
+        return cls(StatusEnum[status], f'{directory}{os.sep}{name}', size, mtime_ns, sha256)
+
+
+def parse_file_name(file_name: str, ext: str,
+                    students: Dict[str, str]) -> Optional[Tuple[str, bool]]:
+    """
+    Find out which student a submitted file belongs to.
+
+    Args:
+        file_name: name of the file
+        ext: file ext name of the mission
+        students: students data
+
+    Returns:
+        Optional[Tuple[str, bool]]: student id and if is confirmed file
+    """
+    start = file_name.find('-')
+    while start != -1:
+        stu_id = file_name[:start]
+        if stu_id in students:
+            stu = Student(stu_id, students[stu_id])
+            if file_name == config.get_file_name(stu, ext):
+                return stu_id, True
+            if file_name == config.get_file_name(stu, ext, False):
+                return stu_id, False
+        start = file_name.find('-', start + 1)
+    return None
+
+
+class SubmissionIndex:
+    """
+    The in-memory index of submissions, keyed by mission url and student id.
+    The stamp of each mission directory is taken before it is scanned,
+    for the snapshot. Uploads and locks are appended to the journal, which
+    is replayed instead of scanning a directory it matches.
+    """
+    submissions: Dict[str, Dict[str, Submission]]
+    stamps: Dict[str, Optional[Stamp]]
+    journal: Optional[SubmissionJournal]
+
+    def __init__(self, journal: Optional[SubmissionJournal] = None):
+        """
+        Initialize the SubmissionIndex.
+
+        Args:
+            self: the instance
+            journal: the journal of uploads and locks, None to keep none
+
+        Returns:
+            SubmissionIndex
+        """
+        self.submissions = {}
+        self.stamps = {}
+        self.journal = journal
+        self.lock = threading.Lock()
+
+    def build(self, missions: Dict[str, Mission], students: Dict[str, str],
+              cached: Optional[Dict[str, Tuple[Stamp, Dict[str, tuple]]]] = None
+              ) -> Tuple[int, int]:
+        """
+        Rebuild the index of all missions.
+        A mission found in cached is not scanned if its directory is unchanged,
+        nor is one whose journal matches its directory; their files are only
+        stated, to find the ones overwritten in place. The journal of a
+        mission scanned is rebased on the scan.
+
+        Args:
+            self: the instance
+            missions: missions data
+            students: students data
+            cached: stamps and rows of the entries of missions from a snapshot,
+                of the same students and missions
+
+        Returns:
+            Tuple[int, int]: count of missions read from cached, and replayed from the journal
+        """
+        logger.info("BUILD_INDEX")
+        cached = cached or {}
+        submissions = {}
+        stamps = {}
+        reused = replayed = 0
+        for mission in missions.values():
+            stamp = self.stamp(mission)
+            if stamp and mission.mission_url in cached and cached[mission.mission_url][0] == stamp:
+                directory = str(config.received_path / mission.subpath)
+                entries = {stu_id: Submission.from_row(row, directory)
+                           for stu_id, row in cached[mission.mission_url][1].items()}
+                self.verify(entries)
+                reused += 1
+            else:
+                entries = self.replay(mission, students, stamp)
+                if entries is not None:
+                    if self.verify(entries):
+                        self.rebase(mission, entries, stamp)
+                    replayed += 1
+                else:
+                    entries = self.scan(mission, students)
+                    self.rebase(mission, entries, stamp)
+            submissions[mission.mission_url] = entries
+            stamps[mission.mission_url] = stamp
+        with self.lock:
+            self.submissions = submissions
+            self.stamps = stamps
+        return reused, replayed
+
+    def replay(self, mission: Mission, students: Dict[str, str],
+               stamp: Optional[Stamp]) -> Optional[Dict[str, Submission]]:
+        """
+        Replay the journal of a mission, if it matches the directory:
+        the directory is unchanged since the last record, and every file
+        recorded is named after its student as they are now.
 
-    async def load(self) -> None:
+        Args:
+            self: the instance
+            mission: the mission
+            students: students data
+            stamp: stamp of the directory of the mission
+
+        Returns:
+            Optional[Dict[str, Submission]]: submissions keyed by student id,
+                None if the journal does not match
+        """
+        if self.journal is None or stamp is None:
+            return None
+        folded = self.journal.replay(mission.mission_url)
+        if folded is None or folded[0] != stamp:
+            return None
+        directory = str(config.received_path / mission.subpath)
+        entries = {}
+        for stu_id, record in folded[1].items():
+            confirmed = record['new'] == StatusEnum.LOCKED.name
+            if parse_file_name(record['file'], mission.ext, students) != (stu_id, confirmed):
+                return None
+            entries[stu_id] = Submission.from_record(record, directory)
+        return entries
+
+    @staticmethod
+    def verify(entries: Dict[str, Submission]) -> int:
+        """
+        Check submissions from a snapshot or a journal against their files.
+        A file overwritten in place leaves the stamp of its directory
+        unchanged, so each one is stated; changed ones are read again.
+
+        Args:
+            entries: submissions keyed by student id, updated in place
+
+        Returns:
+            int: count of submissions changed
         """
-        load the file info of a student.
-        Called by AwaitLoader before loading properties.
+        changed = 0
+        settled = time.time_ns() - RACY_SECONDS * 10 ** 9
+        for stu_id, submission in list(entries.items()):
+            try:
+                stat = os.stat(submission.raw_path)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and stat.st_mtime_ns < settled and \
+                    (stat.st_size, stat.st_mtime_ns) == (submission.size, submission.mtime_ns):
+                continue
+            changed += 1
+            stored = received_storage.stat(submission.path)
+            if stored is None:
+                del entries[stu_id]
+                continue
+            entries[stu_id] = Submission(status=submission.status,
+                                         path=submission.path,
+                                         size=stored.size,
+                                         mtime_ns=stored.mtime_ns,
+                                         sha256=stored.sha256)
+        return changed
+
+    def rebase(self, mission: Mission, entries: Dict[str, Submission],
+               stamp: Optional[Stamp]) -> None:
+        """
+        Replace the journal of a mission with the submissions scanned,
+        so the next build replays it.
 
         Args:
             self: the instance
+            mission: the mission
+            entries: submissions keyed by student id
+            stamp: stamp of the directory, taken before the scan
 
         Returns:
             None
         """
-        mis = self.mission
-        stu = self.student
-        mission_path = config.received_path / mis.subpath
+        if self.journal is None or stamp is None:
+            return
+        now = round(time.time(), 3)
+        records = {stu_id: dict(time=now, op=STATE_OP, mission=mission.mission_url,
+                                student=stu_id, old=submission.status.name,
+                                **submission.to_record())
+                   for stu_id, submission in entries.items()}
+        try:
+            self.journal.rebase(mission.mission_url, records, stamp)
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('journal not rebased: %s', exception)
+
+    @staticmethod
+    def stamp(mission: Mission) -> Optional[Stamp]:
+        """
+        Get the stamp of the directory of a mission, which changes when
+        a file is saved, locked or removed in it.
+        Only directories on local storage have one.
+
+        Args:
+            mission: the mission
+
+        Returns:
+            Optional[Stamp]: the stamp, None if unknown
+        """
+        if not received_storage.watched:
+            return None
+        return stamp_of(config.received_path / mission.subpath)
+
+    def scan(self, mission: Mission, students: Dict[str, str]) -> Dict[str, Submission]:
+        """
+        Scan the directory of a mission in the storage.
+
+        Args:
+            self: the instance
+            mission: the mission to scan
+            students: students data
+
+        Returns:
+            Dict[str, Submission]: submissions keyed by student id
+        """
+        mission_path = config.received_path / mission.subpath
         mission_path.mkdir(parents=True, exist_ok=True)
-        unconfirmed_filepath = mission_path / \
-            config.get_file_name(stu, mis.ext, False)
-        confirmed_filepath = mission_path / \
-            config.get_file_name(stu, mis.ext)
-
-        if confirmed_filepath.exists():
-            self.status = StatusEnum.LOCKED
-            self.sub_file_path = confirmed_filepath
-            self.sub_size = ByteSize(confirmed_filepath.stat().st_size)
-            self.sub_time = datetime.fromtimestamp(
-                confirmed_filepath.stat().st_mtime)
-        if unconfirmed_filepath.exists():
-            self.status = StatusEnum.UPLOADED
-            self.sub_file_path = unconfirmed_filepath
-            self.sub_size = ByteSize(unconfirmed_filepath.stat().st_size)
-            self.sub_time = datetime.fromtimestamp(
-                unconfirmed_filepath.stat().st_mtime)
-
-    @async_cached_property
-    async def submitted(self) -> bool:
+        entries = {}
+        for stored in received_storage.list(mission_path):
+            found = parse_file_name(stored.path.name, mission.ext, students)
+            if found is None:
+                continue
+            stu_id, confirmed = found
+            # an unconfirmed file overrides the confirmed one
+            if confirmed and stu_id in entries:
+                continue
+            entries[stu_id] = Submission(
+                status=StatusEnum.LOCKED if confirmed else StatusEnum.UPLOADED,
+                path=stored.path,
+                size=stored.size,
+                mtime_ns=stored.mtime_ns,
+                sha256=stored.sha256)
+        return entries
+
+    def update(self, mission: Mission, students: Dict[str, str]) -> None:
+        """
+        Rescan the directory of a mission and replace its entries.
+
+        Args:
+            self: the instance
+            mission: the mission to scan
+            students: students data
+
+        Returns:
+            None
+        """
+        stamp = self.stamp(mission)
+        entries = self.scan(mission, students)
+        with self.lock:
+            self.submissions[mission.mission_url] = entries
+            self.stamps[mission.mission_url] = stamp
+
+    def remove(self, mission_url: str) -> None:
+        """
+        Remove the entries of a mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.submissions.pop(mission_url, None)
+            self.stamps.pop(mission_url, None)
+
+    def refresh(self, mission: Mission, student: Student) -> Optional[Submission]:
+        """
+        Refresh the submission of a student from the storage.
+
+        Args:
+            self: the instance
+            mission: the mission
+            student: the student
+
+        Returns:
+            Optional[Submission]: the submission
+        """
+        mission_path = config.received_path / mission.subpath
+        submission = None
+        for confirmed, status in [(True, StatusEnum.LOCKED), (False, StatusEnum.UPLOADED)]:
+            filepath = mission_path / \
+                config.get_file_name(student, mission.ext, confirmed)
+            stored = received_storage.stat(filepath)
+            if stored is None:
+                continue
+            submission = Submission(status=status,
+                                    path=filepath,
+                                    size=stored.size,
+                                    mtime_ns=stored.mtime_ns,
+                                    sha256=stored.sha256)
+        with self.lock:
+            entries = self.submissions.setdefault(mission.mission_url, {})
+            if submission:
+                entries[student.stu_id] = submission
+            else:
+                entries.pop(student.stu_id, None)
+        return submission
+
+    def record(self, op: str, mission: Mission, student: Student,
+               previous: Optional[Submission]) -> Optional[Submission]:
+        """
+        Refresh the submission of a student after an upload or lock,
+        and append the change to the journal.
+
+        Args:
+            self: the instance
+            op: 'upload' or 'lock'
+            mission: the mission
+            student: the student
+            previous: the submission before the change
+
+        Returns:
+            Optional[Submission]: the submission
+        """
+        submission = self.refresh(mission, student)
+        if self.journal is None:
+            return submission
+        stamp = stamp_of(config.received_path / mission.subpath, settled=False) \
+            if received_storage.watched else None
+        values = submission.to_record() if submission else \
+            dict.fromkeys(['new', 'file', 'size', 'mtime_ns', 'sha256'])
+        record = dict(time=round(time.time(), 3), op=op, mission=mission.mission_url,
+                      student=student.stu_id, old=previous.status.name if previous else None,
+                      **values, dir=list(stamp) if stamp else None)
+        try:
+            self.journal.append(mission.mission_url, record)
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('journal not appended: %s', exception)
+        return submission
+
+    def get(self, mission_url: str, stu_id: str) -> Optional[Submission]:
+        """
+        Get the submission of a student.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+            stu_id: student id
+
+        Returns:
+            Optional[Submission]: the submission
+        """
+        return self.submissions.get(mission_url, {}).get(stu_id)
+
+    def count(self, mission_url: str) -> int:
+        """
+        Count the students who have submitted a mission.
+
+        Args:
+            self: the instance
+            mission_url: the url-name of the mission
+
+        Returns:
+            int: count of students
+        """
+        return len(self.submissions.get(mission_url, {}))
+
+
+class UserFileInfo:
+    """
+    The class defines info of user file.
+    """
+    __slots__ = ('status', 'sub_file_path', 'sub_size', 'sub_time', 'sub_hash')
+    status: StatusEnum
+    sub_file_path: Optional[Path]
+    sub_size: Optional[ByteSize]
+    sub_time: Optional[datetime]
+    sub_hash: Optional[str]
+
+    def __init__(self, submission: Optional[Submission]):
+        """
+        Initialize the UserFileInfo from an index entry.
+
+        Args:
+            self: the instance
+            submission: the submission, None if not submitted
+
+        Returns:
+            UserFileInfo
+        """
+        if submission:
+            self.status = submission.status
+            self.sub_file_path = submission.path
+            self.sub_size = ByteSize(submission.size)
+            self.sub_time = submission.mtime
+            self.sub_hash = submission.sha256
+        else:
+            self.status = StatusEnum.EMPTY
+            self.sub_file_path = self.sub_size = self.sub_time = self.sub_hash = None
+
+    @property
+    def submitted(self) -> bool:
         """
         (Read-only)
         If student has submitted.
@@ -116,37 +613,47 @@ class UserFileInfo(AwaitLoader):
         Returns:
             Bool
         """
-        if self.status in [StatusEnum.LOCKED, StatusEnum.UPLOADED]:
-            return True
-        return False
+        return self.status != StatusEnum.EMPTY
 
 
-class MissionStatus(AwaitLoader):
+EMPTY_FILE_INFO = UserFileInfo(None)
+
+
+class MissionStatus:
     """
     The class defines a mission status.
     """
+    __slots__ = ('mission', 'student', 'index', 'file_info', 'finish_rate')
     mission: Mission
     student: Student
+    index: SubmissionIndex
+    file_info: UserFileInfo
     finish_rate: Optional[float]
 
     def __init__(self, mission: Mission,
-                 student: Student):
+                 student: Student,
+                 index: SubmissionIndex):
         """
-        Initialize the MissionStatus.
+        Initialize the MissionStatus, reading the file info from the index.
 
         Args:
             self: the instance
+            mission: the mission
+            student: the student
+            index: the submission index
 
         Returns:
             MissionStatus
         """
         self.mission = mission
         self.student = student
+        self.index = index
         self.finish_rate = None
+        INDEX_LOOKUPS.inc('file_info')
+        submission = index.get(mission.mission_url, student.stu_id)
+        self.file_info = UserFileInfo(submission) if submission else EMPTY_FILE_INFO
 
-        AwaitLoader.__init__(self)
-
-    async def get_finish_rate(self, stu_count:int) -> Optional[float]:
+    def get_finish_rate(self, stu_count: int) -> None:
         """
         Calculate the finish rate of a mission.
 
@@ -155,27 +662,11 @@ class MissionStatus(AwaitLoader):
             stu_count: count of students
 
         Returns:
-            Optional[Float]
-        """
-
-        mission_path = config.received_path / self.mission.subpath
-        mission_path.mkdir(parents=True, exist_ok=True)
-        self.finish_rate = 100 * len(list(mission_path.glob('*'))) / stu_count
-
-    @async_cached_property
-    async def file_info(self) -> UserFileInfo:
-        """
-        (Read-only)
-        Get the user file info from a student.
-
-        Args:
-            self: the instance
-
-        Returns:
-            UserFileInfo
+            None
         """
-        return await UserFileInfo(student=self.student,
-                                  mission=self.mission)
+        INDEX_LOOKUPS.inc('finish_rate')
+        self.finish_rate = 100 * \
+            self.index.count(self.mission.mission_url) / stu_count
 
     @property
     def remain(self) -> timedelta:
@@ -191,8 +682,8 @@ class MissionStatus(AwaitLoader):
         """
         return self.mission.deadline - datetime.today()
 
-    @async_cached_property
-    async def avaliable(self) -> bool:
+    @property
+    def avaliable(self) -> bool:
         """
         (Read-only)
         If submission is avaliable to student.
@@ -203,7 +694,7 @@ class MissionStatus(AwaitLoader):
         Returns:
             Bool
         """
-        if (await self.file_info).status == StatusEnum.LOCKED or self.remain.total_seconds() < 0:
+        if self.file_info.status == StatusEnum.LOCKED or self.remain.total_seconds() < 0:
             return False
         return True
 
@@ -213,9 +704,22 @@ class Store(BaseModel):
     The store for datas in a collector instance.
     """
     students: Dict[str, str]
+    student_objs: Any
     missions: Dict[str, Mission]
-    checkers: Dict[str, Callable]
+    checkers: Dict[str, Path]
+    checker_hashes: Dict[str, str]
+    index: Any
     observer: Any
+    shared: Any
+    generation: int
+    buckets: List[int]
+    sequence: int
+    pending: Any
+    pending_lock: Any
+    sync_lock: Any
+    timer: Any
+    snapshot: Any
+    sources: Dict[str, Any]
 
     def __init__(self):
         """
@@ -229,15 +733,144 @@ class Store(BaseModel):
         """
         BaseModel.__init__(self,
                            students={},
+                           student_objs={},
                            missions={},
                            checkers={},
-                           observer=Observer())
+                           checker_hashes={},
+                           index=SubmissionIndex(SubmissionJournal(config.journal_path)
+                                                 if config.SUBMISSION_JOURNAL else None),
+                           observer=Observer(),
+                           shared=SharedState() if config.SHARED_STATE else None,
+                           generation=0,
+                           buckets=[0] * config.SHARED_BUCKETS,
+                           sequence=0,
+                           pending=set(),
+                           pending_lock=threading.Lock(),
+                           sync_lock=threading.Lock(),
+                           timer=None,
+                           snapshot=StoreSnapshot(config.snapshot_path)
+                           if config.STORE_SNAPSHOT else None,
+                           sources={})
         self.read_data()
         self.__start_observer()
 
+    def get_student(self, stu_id: Optional[str]) -> Optional[Student]:
+        """
+        Get a student, reusing the object built by an earlier request.
+
+        Args:
+            self: the instance
+            stu_id: student id
+
+        Returns:
+            Optional[Student]: the student, None if not found
+        """
+        name = self.students.get(stu_id)
+        if name is None:
+            return None
+        student = self.student_objs.get(stu_id)
+        if student is None or student.name != name:
+            student = self.student_objs[stu_id] = Student(stu_id, name)
+        return student
+
+    def get_missions_status(self, student: Student) -> List[MissionStatus]:
+        """
+        Get the status of every mission for a student in one pass.
+        Statuses and finish rates are read from the submission index,
+        so no local storage is touched.
+
+        Args:
+            self: the instance
+            student: the student
+
+        Returns:
+            List[MissionStatus]: statuses sorted by mission url
+        """
+        missions = self.missions
+        stu_count = len(self.students)
+        missions_status = []
+        for key in sorted(missions):
+            mission_status = MissionStatus(student=student,
+                                           mission=missions[key],
+                                           index=self.index)
+            mission_status.get_finish_rate(stu_count)
+            missions_status.append(mission_status)
+        return missions_status
+
+    def sync(self) -> None:
+        """
+        Catch up with the changes published by the master process,
+        one thread at a time.
+        Does nothing unless the store is shared with forked workers.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        if self.shared is None or not self.shared.is_worker:
+            return
+        if self.shared.generation.value == self.generation and \
+                self.shared.sequence.value == self.sequence:
+            return
+
+        # requests arriving meanwhile wait, and find the store caught up
+        with self.sync_lock:
+            generation = self.shared.generation.value
+            if generation != self.generation:
+                logger.info("SYNC_DATA %s", generation)
+                start = time.perf_counter()
+                # the build sees every file changed before it starts
+                self.sequence = self.shared.sequence.value
+                self.buckets = self.shared.read_buckets()
+                data = self.shared.load()
+                self.students = data['students']
+                self.missions = data['missions']
+                self.read_checkers()
+                self.index.build(self.missions, self.students)
+                self.generation = generation
+                STORE_RELOAD.observe(time.perf_counter() - start, 'sync')
+
+            if self.shared.sequence.value != self.sequence:
+                sequence, changes = self.shared.read_changes(self.sequence)
+                buckets = self.shared.read_buckets()
+                if changes is None:
+                    changed = {bucket for bucket, (old, new) in
+                               enumerate(zip(self.buckets, buckets)) if old != new}
+                    for mission in list(self.missions.values()):
+                        if self.shared.bucket_of(mission.subpath) in changed:
+                            self.index.update(mission, self.students)
+                else:
+                    for change in dict.fromkeys(changes):
+                        self.refresh_entries(config.received_path / change)
+                self.sequence = sequence
+                self.buckets = buckets
+
+    def publish(self) -> None:
+        """
+        Publish the parsed data to the forked workers.
+        Does nothing unless the store is shared with forked workers.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        if self.shared is None or self.shared.is_worker:
+            return
+        try:
+            self.shared.publish({'students': self.students,
+                                 'missions': self.missions})
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('publish failed: %s', exception)
+
     def read_data(self) -> None:
         """
         Read data from local storage.
+        Files unchanged since the snapshot are not read again, and the
+        time spent on each part is logged.
 
         Args:
             self: the instance
@@ -246,68 +879,327 @@ class Store(BaseModel):
             None
         """
         logger.info("READ_DATA")
-        self.read_students()
-        self.read_missions()
-        self.read_checkers()
+        start = time.perf_counter()
+        with paused_gc():
+            snapshot = self.snapshot.load() if self.snapshot else {}
+            loaded = time.perf_counter()
+            self.sources = {}
+            students_cached = self.read_students(snapshot)
+            students_read = time.perf_counter()
+            missions_cached = self.read_missions(snapshot)
+            missions_read = time.perf_counter()
+            checkers_cached = self.read_checkers(snapshot)
+            checkers_read = time.perf_counter()
+            cached_missions = snapshot.get('missions', {})
+            cached_index = snapshot.get('index', {}) if students_cached else {}
+            # entries of a mission are only valid for the same subpath and ext
+            index_cached, index_replayed = self.index.build(self.missions, self.students, {
+                mission_url: entries for mission_url, entries in cached_index.items()
+                if cached_missions.get(mission_url) == self.missions.get(mission_url)})
+            index_read = time.perf_counter()
+            if not students_cached or missions_cached < len(self.missions) or \
+                    checkers_cached < len(self.checkers) or index_cached < len(self.missions):
+                self.save_snapshot()
+            saved = time.perf_counter()
+        end = time.perf_counter()
+        STORE_RELOAD.observe(end - start, 'full')
+        logger.info('READ_DATA %.1fms: snapshot %.1fms, students %.1fms%s, '
+                    'missions %.1fms (%d/%d cached), checkers %.1fms (%d/%d cached), '
+                    'index %.1fms (%d/%d cached, %d replayed), save %.1fms',
+                    1000 * (end - start), 1000 * (loaded - start),
+                    1000 * (students_read - loaded), ' (cached)' if students_cached else '',
+                    1000 * (missions_read - students_read), missions_cached, len(self.missions),
+                    1000 * (checkers_read - missions_read), checkers_cached, len(self.checkers),
+                    1000 * (index_read - checkers_read), index_cached, len(self.missions),
+                    index_replayed, 1000 * (saved - index_read))
+
+    def save_snapshot(self) -> None:
+        """
+        Write the snapshot of the data read, for the next start.
+        Does nothing unless STORE_SNAPSHOT is set.
 
-    def read_students(self) -> None:
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        if self.snapshot is None:
+            return
+        with self.index.lock:
+            entries = {mission_url: (stamp, dict(self.index.submissions[mission_url]))
+                       for mission_url, stamp in self.index.stamps.items()
+                       if stamp and mission_url in self.index.submissions}
+        index = {mission_url: (stamp, {stu_id: submission.to_row()
+                                       for stu_id, submission in submissions.items()})
+                 for mission_url, (stamp, submissions) in entries.items()}
+        self.snapshot.save({'sources': dict(self.sources),
+                            'students': self.students,
+                            'missions': self.missions,
+                            'checker_hashes': self.checker_hashes,
+                            'index': index})
+
+    def is_cached(self, path: Path, snapshot: dict) -> bool:
+        """
+        Check if a file is unchanged since the snapshot, recording its stamp.
+
+        Args:
+            self: the instance
+            path: path of the file
+            snapshot: the snapshot
+
+        Returns:
+            bool: if the file is unchanged
+        """
+        stamp = self.sources[str(path)] = stamp_of(path)
+        return stamp is not None and snapshot.get('sources', {}).get(str(path)) == stamp
+
+    def read_students(self, snapshot: Optional[dict] = None) -> bool:
         """
         Read students data from local storage.
 
         Args:
             self: the instance
+            snapshot: the snapshot, to reuse its students if unchanged
 
         Returns:
-            None
+            bool: if the students of the snapshot are reused
         """
+        snapshot = snapshot or {}
+        if self.is_cached(config.students_path, snapshot) and 'students' in snapshot:
+            self.students = snapshot['students']
+            return True
         logger.info("READ_STU_DATA")
-        self.students = {}
+        students = {}
         if config.students_path.exists():
             try:
-                self.students = json.loads(
+                students = json.loads(
                     config.students_path.read_text(encoding='UTF-8'))
             except Exception as exception:  # pylint: disable=broad-except
                 logger.warning('config invalid: %s', exception.args[0])
+        self.students = students
+        return False
 
-    def read_missions(self) -> None:
+    def read_missions(self, snapshot: Optional[dict] = None) -> int:
         """
         Read missions data from local storage.
 
         Args:
             self: the instance
+            snapshot: the snapshot, to reuse its missions which are unchanged
 
         Returns:
-            None
+            int: count of missions reused
         """
         logger.info("READ_MIS_DATA")
-        self.missions = {}
-        for mission in list(config.missions_path.glob('**/*.json')):
-            try:
-                self.missions[mission.stem] = Mission(
-                    mission_url=mission.stem,
-                    **json.loads(mission.read_text(encoding='UTF-8')))
-            except Exception as exception:  # pylint: disable=broad-except
-                logger.warning('config invalid: %s', exception.args[0])
+        snapshot = snapshot or {}
+        cached_missions = snapshot.get('missions', {})
+        missions = {}
+        cached = 0
+        for mission_path in list(config.missions_path.glob('**/*.json')):
+            if self.is_cached(mission_path, snapshot) and mission_path.stem in cached_missions:
+                mission = cached_missions[mission_path.stem]
+                cached += 1
+            else:
+                mission = self.read_mission(mission_path)
+            if mission:
+                missions[mission.mission_url] = mission
+        self.missions = missions
+        return cached
+
+    @staticmethod
+    def read_mission(mission_path: Path) -> Optional[Mission]:
+        """
+        Read a mission from local storage.
 
-    def read_checkers(self) -> None:
+        Args:
+            mission_path: path of the mission
+
+        Returns:
+            Optional[Mission]: the mission, None if it is missing or invalid
+        """
+        try:
+            return Mission(mission_url=mission_path.stem,
+                           **json.loads(mission_path.read_text(encoding='UTF-8')))
+        except FileNotFoundError:
+            return None
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.warning('config invalid: %s', exception.args[0])
+            return None
+
+    def read_checkers(self, snapshot: Optional[dict] = None) -> int:
         """
         Read chckers data from local storage.
 
         Args:
             self: the instance
+            snapshot: the snapshot, to reuse the hashes of unchanged checkers
 
         Returns:
-            None
+            int: count of checkers reused
         """
         logger.info("READ_CHK_DATA")
-        self.checkers = {}
-        for checker in list(config.missions_path.glob('**/*.py')):
+        snapshot = snapshot or {}
+        cached_hashes = snapshot.get('checker_hashes', {})
+        checkers = {}
+        checker_hashes = {}
+        cached = 0
+        for checker_path in list(config.missions_path.glob('**/*.py')):
+            if self.is_cached(checker_path, snapshot) and checker_path.stem in cached_hashes:
+                checker = checker_path, cached_hashes[checker_path.stem]
+                cached += 1
+            else:
+                checker = self.read_checker(checker_path)
+            if checker:
+                checkers[checker_path.stem], checker_hashes[checker_path.stem] = checker
+        self.checkers = checkers
+        self.checker_hashes = checker_hashes
+        return cached
+
+    @staticmethod
+    def read_checker(checker_path: Path) -> Optional[Tuple[Path, str]]:
+        """
+        Read a checker from local storage.
+        The checker is only hashed here, it is loaded on first use.
+
+        Args:
+            checker_path: path of the checker
+
+        Returns:
+            Optional[Tuple[Path, str]]: path of the checker and hash of its source,
+                None if it is missing
+        """
+        try:
+            return checker_path, hashlib.sha256(checker_path.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def reload(self, paths: Set[Path]) -> None:
+        """
+        Reload the changed files only, then swap in the new data at once.
+        Paths of no student, mission or checker are ignored.
+
+        Args:
+            self: the instance
+            paths: paths of the changed files
+
+        Returns:
+            None
+        """
+        logger.info("RELOAD_DATA %s", sorted(map(str, paths)))
+        start = time.perf_counter()
+        missions = dict(self.missions)
+        checkers = dict(self.checkers)
+        checker_hashes = dict(self.checker_hashes)
+        changed_missions = []
+        removed_missions = []
+        students_changed = False
+        matched = False
+
+        for path in paths:
+            if path == config.students_path:
+                students_changed = True
+                continue
             try:
-                invalidate_caches()
-                self.checkers[checker.stem] = import_module(
-                    f'{config.import_root}{checker.stem}').main
-            except Exception as exception:  # pylint: disable=broad-except
-                logger.warning('config invalid: %s', exception.args[0])
+                path.relative_to(config.missions_path)
+            except ValueError:
+                continue
+            if path.suffix not in ('.json', '.py'):
+                continue
+            matched = True
+            self.sources[str(path)] = stamp_of(path)
+            if path.suffix == '.json':
+                mission = self.read_mission(path)
+                if mission:
+                    missions[path.stem] = mission
+                    changed_missions.append(mission)
+                elif missions.pop(path.stem, None):
+                    removed_missions.append(path.stem)
+            elif path.suffix == '.py':
+                checker = self.read_checker(path)
+                if checker:
+                    checkers[path.stem], checker_hashes[path.stem] = checker
+                else:
+                    checkers.pop(path.stem, None)
+                    checker_hashes.pop(path.stem, None)
+
+        if not students_changed and not matched:
+            # nothing read, nothing to publish
+            return
+        if students_changed:
+            self.read_students()
+        self.missions = missions
+        self.checkers = checkers
+        self.checker_hashes = checker_hashes
+
+        if students_changed:
+            self.index.build(self.missions, self.students)
+        else:
+            for mission in changed_missions:
+                self.index.update(mission, self.students)
+            for mission_url in removed_missions:
+                self.index.remove(mission_url)
+        STORE_RELOAD.observe(time.perf_counter() - start, 'incremental')
+        self.publish()
+        self.save_snapshot()
+
+    def reload_pending(self) -> None:
+        """
+        Reload the files changed during the debounce window.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        with self.pending_lock:
+            paths = self.pending
+            self.pending = set()
+            self.timer = None
+        if paths:
+            self.reload(paths)
+
+    def refresh_submission(self, path: Path) -> None:
+        """
+        Refresh the index entry of a received file, and notify the workers.
+
+        Args:
+            self: the instance
+            path: path of the received file
+
+        Returns:
+            None
+        """
+        if self.refresh_entries(path) and self.shared is not None:
+            self.shared.touch(path.parent.relative_to(config.received_path).as_posix(),
+                              path.name)
+
+    def refresh_entries(self, path: Path) -> bool:
+        """
+        Refresh the index entries of a received file.
+
+        Args:
+            self: the instance
+            path: path of the received file
+
+        Returns:
+            bool: if it is the file of a student in a mission
+        """
+        try:
+            subpath = path.parent.relative_to(config.received_path)
+        except ValueError:
+            return False
+        refreshed = False
+        for mission in list(self.missions.values()):
+            if Path(mission.subpath) != subpath:
+                continue
+            found = parse_file_name(path.name, mission.ext, self.students)
+            if found is None:
+                continue
+            self.index.refresh(mission, self.get_student(found[0]))
+            refreshed = True
+        return refreshed
 
     def __start_observer(self) -> None:
         """
@@ -335,20 +1227,56 @@ class Store(BaseModel):
             if event.is_directory:
                 return
 
-            if event.event_type == EVENT_TYPE_CREATED:
+            if event.event_type not in CHANGE_EVENT_TYPES:
                 return
 
-            path = Path(event.src_path)
             logger.debug('%s:%s', event.event_type, event.src_path)
-            if path.name == config.STUDENTS_SUBPATH:
-                self.read_students()
-            elif path.suffix == '.json':
-                self.read_missions()
-            elif path.suffix == '.py':
-                self.read_checkers()
+            paths = [event.src_path]
+            if hasattr(event, 'dest_path'):
+                paths.append(event.dest_path)
+            paths = {path for path in map(Path, paths)
+                     if path == config.students_path or path.suffix in ['.json', '.py']}
+            if not paths:
+                return
+
+            with self.pending_lock:
+                self.pending.update(paths)
+                if self.timer:
+                    self.timer.cancel()
+                self.timer = threading.Timer(config.RELOAD_DEBOUNCE,
+                                             self.reload_pending)
+                self.timer.daemon = True
+                self.timer.start()
+
+        def dispatch_received(event) -> None:
+            """
+            Dispatches events of received files to the index.
+
+            Args:
+                event: The event object representing the file system event.
+
+            Returns:
+                None
+            """
+            if event.is_directory:
+                return
+
+            if event.event_type not in CHANGE_EVENT_TYPES + [EVENT_TYPE_CREATED]:
+                return
+
+            paths = [event.src_path]
+            if hasattr(event, 'dest_path'):
+                paths.append(event.dest_path)
+            for path in map(Path, paths):
+                self.refresh_submission(path)
 
         event_handler.dispatch = dispatch
+        received_handler = FileSystemEventHandler()
+        received_handler.dispatch = dispatch_received
 
+        config.received_path.mkdir(parents=True, exist_ok=True)
         self.observer.schedule(
             event_handler, config.db_path, recursive=True)
+        self.observer.schedule(
+            received_handler, config.received_path, recursive=True)
         self.observer.start()
@@ -0,0 +1,247 @@
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+import fcntl
+import logging
+import os
+import re
+import uuid
+
+import aiofiles
+from fastapi import UploadFile
+from pydantic import BaseModel
+
+from storage import FileTooLarge, SavedFile, received_storage
+from store import Mission, Student
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetMismatch(Exception):
+    """
+    The exception raised when a chunk does not start at the received offset.
+    """
+
+
+class SessionBusy(Exception):
+    """
+    The exception raised when a chunk of the session is being written.
+    """
+
+
+class UploadSession(BaseModel):
+    """
+    The class defines a resumable upload session.
+    """
+    upload_id: str
+    stu_id: str
+    mission_url: str
+    filename: str
+    size: int
+    created: datetime
+
+
+def allowed_file(filename: str, allowed_extension: str) -> bool:
+    """
+    Check if the filename has allowed extension.
+
+    Args:
+        filename: name of the file uploaded
+        allowed_extension: extension allowed
+
+    Returns:
+        bool: if the filename has allowed extension
+    """
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() == allowed_extension
+
+
+async def save_upload(file: UploadFile, target: Path, max_size: int) -> SavedFile:
+    """
+    Stream the uploaded file to target in fixed-size chunks, through the storage.
+
+    Args:
+        file: file uploaded
+        target: path of the saved file
+        max_size: maximum size allowed, in bytes
+
+    Returns:
+        SavedFile: size and hash of the file, and if target was changed
+
+    Raises:
+        FileTooLarge: the file is larger than max_size
+    """
+    async def chunks() -> AsyncIterator[bytes]:
+        while chunk := await file.read(config.UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+    saved = await received_storage.save(chunks(), target, max_size)
+    logger.debug({'target': target, 'size': saved.size, 'sha256': saved.sha256})
+    return saved
+
+
+def session_path(mission: Mission) -> Path:
+    """
+    Get the directory of upload sessions of a mission.
+
+    Args:
+        mission: the mission
+
+    Returns:
+        Path: the directory
+    """
+    return config.uploads_path / mission.subpath
+
+
+def create_session(mission: Mission, student: Student,
+                   filename: str, size: int) -> UploadSession:
+    """
+    Create a resumable upload session.
+
+    Args:
+        mission: the mission
+        student: the student
+        filename: name of the file to upload
+        size: size of the file to upload
+
+    Returns:
+        UploadSession: the session
+    """
+    cleanup_sessions(mission)
+    upload = UploadSession(upload_id=uuid.uuid4().hex,
+                           stu_id=student.stu_id,
+                           mission_url=mission.mission_url,
+                           filename=filename,
+                           size=size,
+                           created=datetime.now())
+    directory = session_path(mission)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f'{upload.upload_id}.part').touch()
+    (directory / f'{upload.upload_id}.meta').write_text(upload.json(), encoding='UTF-8')
+    logger.debug({'upload_session': upload})
+    return upload
+
+
+def load_session(mission: Mission, upload_id: str) -> Optional[UploadSession]:
+    """
+    Load a resumable upload session.
+
+    Args:
+        mission: the mission
+        upload_id: id of the session
+
+    Returns:
+        Optional[UploadSession]: the session, None if not found
+    """
+    if not re.fullmatch('[0-9a-f]{32}', upload_id):
+        return None
+    try:
+        return UploadSession.parse_file(session_path(mission) / f'{upload_id}.meta')
+    except FileNotFoundError:
+        return None
+
+
+def session_offset(mission: Mission, upload: UploadSession) -> int:
+    """
+    Get the count of bytes received by a session.
+
+    Args:
+        mission: the mission
+        upload: the session
+
+    Returns:
+        int: the offset
+    """
+    return (session_path(mission) / f'{upload.upload_id}.part').stat().st_size
+
+
+async def write_chunk(mission: Mission, upload: UploadSession,
+                      offset: int, stream: AsyncIterator[bytes]) -> int:
+    """
+    Append a chunk to a session.
+    The chunk must start at the offset already received.
+
+    Args:
+        mission: the mission
+        upload: the session
+        offset: offset of the chunk
+        stream: content of the chunk
+
+    Returns:
+        int: the offset after the chunk
+
+    Raises:
+        OffsetMismatch: the chunk does not start at the received offset
+        FileTooLarge: the chunk goes past the size of the session
+        SessionBusy: another chunk of the session is being written
+    """
+    part_path = session_path(mission) / f'{upload.upload_id}.part'
+    async with aiofiles.open(part_path, 'ab') as part:
+        try:
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as exception:
+            raise SessionBusy() from exception
+        received = os.fstat(part.fileno()).st_size
+        if offset != received:
+            raise OffsetMismatch(received)
+        async for chunk in stream:
+            received += len(chunk)
+            if received > upload.size:
+                await part.flush()
+                os.ftruncate(part.fileno(), offset)
+                raise FileTooLarge(received)
+            await part.write(chunk)
+    return received
+
+
+def finalize_session(mission: Mission, upload: UploadSession, target: Path) -> None:
+    """
+    Save the received file of a session to target and close the session.
+
+    Args:
+        mission: the mission
+        upload: the session
+        target: path of the saved file
+
+    Returns:
+        None
+
+    Raises:
+        OffsetMismatch: the file is not completely received
+    """
+    directory = session_path(mission)
+    part_path = directory / f'{upload.upload_id}.part'
+    received = part_path.stat().st_size
+    if received != upload.size:
+        raise OffsetMismatch(received)
+    received_storage.save_file(part_path, target)
+    (directory / f'{upload.upload_id}.meta').unlink(missing_ok=True)
+    logger.debug({'target': target, 'size': received})
+
+
+def cleanup_sessions(mission: Mission) -> None:
+    """
+    Remove the sessions which have received nothing for UPLOAD_SESSION_TTL.
+
+    Args:
+        mission: the mission
+
+    Returns:
+        None
+    """
+    directory = session_path(mission)
+    if not directory.is_dir():
+        return
+    expired = (datetime.now() - timedelta(seconds=config.UPLOAD_SESSION_TTL)).timestamp()
+    with os.scandir(directory) as iterator:
+        for entry in iterator:
+            if not entry.name.endswith('.part'):
+                continue
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.unlink(entry.path)
+                    Path(entry.path).with_suffix('.meta').unlink(missing_ok=True)
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,490 @@
+"""
+Replay a deadline-rush workload against the app and report latency,
+throughput, peak RSS and open fds per scenario.
+
+Usage:
+    python bench/bench.py [--mode inproc|uvicorn] [--students 500] [--missions 8]
+                          [--baseline bench/baseline.json] [--save]
+"""
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+import httpx
+
+APP_PATH = Path(__file__).resolve().parent.parent / 'app'
+BENCH_PATH = Path(__file__).resolve().parent
+CHECKER_TEMPLATE = APP_PATH / 'db_templates' / 'missions' / 'mission5.py'
+
+# weights of the requests mixed into the rush scenario
+RUSH_MIX = {'login': 5, 'list': 40, 'detail': 30, 'upload': 20, 'lock': 5}
+
+
+def make_zip(size: int, seed: int) -> bytes:
+    """
+    Make a zip of about size bytes, with a few members like a real submission.
+
+    Args:
+        size: size of the zip
+        seed: seed of the content
+
+    Returns:
+        bytes: the zip
+    """
+    generator = random.Random(seed)
+    buffer = io.BytesIO()
+    members = max(1, min(20, size // 65536))
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for member in range(members):
+            archive.writestr(f'src/file{member}.bin',
+                             generator.randbytes(size // members))
+    return buffer.getvalue()
+
+
+def make_workspace(root: Path, students: int, missions: int, submitted: float) -> dict:
+    """
+    Generate db/ and received/ with synthetic students, missions and zips.
+    Half of the missions are open, and half of them have a checker.
+
+    Args:
+        root: directory of the workspace
+        students: count of students
+        missions: count of missions
+        submitted: fraction of students having submitted each mission
+
+    Returns:
+        dict: student ids and urls of the open missions
+    """
+    missions_path = root / 'db' / 'missions'
+    missions_path.mkdir(parents=True)
+    student_ids = {f'2022{index:05d}': f'学生{index}' for index in range(students)}
+    (root / 'db' / 'students.json').write_text(
+        json.dumps(student_ids, ensure_ascii=False), encoding='UTF-8')
+
+    generator = random.Random(0)
+    sample = make_zip(64 * 1024, 0)
+    open_missions = []
+    for index in range(missions):
+        mission_url = f'mission{index}'
+        is_open = index % 2 == 0
+        deadline = datetime.now() + timedelta(days=7 if is_open else -7)
+        (missions_path / f'{mission_url}.json').write_text(json.dumps({
+            'name': f'任务{index}',
+            'description': f'第{index}次作业',
+            'subpath': f'{mission_url}Path',
+            'ext': 'zip',
+            'size': 64 * 1024 * 1024,
+            'deadline': deadline.isoformat(timespec='seconds'),
+        }, ensure_ascii=False), encoding='UTF-8')
+        if index % 4 < 2:
+            shutil.copy(CHECKER_TEMPLATE, missions_path / f'{mission_url}.py')
+        if is_open:
+            open_missions.append(mission_url)
+
+        received = root / 'received' / f'{mission_url}Path'
+        received.mkdir(parents=True)
+        for stu_id, name in student_ids.items():
+            if generator.random() >= submitted:
+                continue
+            locked = generator.random() < 0.3
+            suffix = 'zip' if locked else 'unconfirmed.zip'
+            (received / f'{stu_id}-{name}.{suffix}').write_bytes(sample)
+
+    for directory in ['templates', 'static']:
+        (root / directory).symlink_to(APP_PATH / directory)
+    return {'students': list(student_ids), 'missions': open_missions}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Get a percentile of sorted values.
+
+    Args:
+        values: sorted values
+        fraction: the percentile, between 0 and 1
+
+    Returns:
+        float: the value
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ResourceSampler:
+    """
+    The thread sampling RSS and open fds of a process.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.02):
+        """
+        Initialize the ResourceSampler.
+
+        Args:
+            self: the instance
+            pid: id of the process
+            interval: seconds between samples
+
+        Returns:
+            ResourceSampler
+        """
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_fds = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self) -> None:
+        """
+        Take a sample.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        try:
+            for line in Path(f'/proc/{self.pid}/status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    self.peak_rss = max(self.peak_rss, int(line.split()[1]) * 1024)
+            self.peak_fds = max(self.peak_fds, len(os.listdir(f'/proc/{self.pid}/fd')))
+        except OSError:
+            pass
+
+    def run(self) -> None:
+        """
+        Take samples until stopped.
+
+        Args:
+            self: the instance
+
+        Returns:
+            None
+        """
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> 'ResourceSampler':
+        self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+
+class Workload:
+    """
+    The requests students send around a deadline.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, data: dict, upload_sizes: List[int]):
+        """
+        Initialize the Workload.
+
+        Args:
+            self: the instance
+            client: the client
+            data: student ids and urls of the open missions
+            upload_sizes: sizes of uploaded zips
+
+        Returns:
+            Workload
+        """
+        self.client = client
+        self.students = data['students']
+        self.missions = data['missions']
+        self.payloads = [make_zip(size, seed) for seed, size in enumerate(upload_sizes)]
+        self.generator = random.Random(1)
+
+    def pick(self) -> tuple:
+        """
+        Pick a student and an open mission.
+
+        Args:
+            self: the instance
+
+        Returns:
+            tuple: headers of the student and the mission url
+        """
+        stu_id = self.generator.choice(self.students)
+        return {'Cookie': f'stu_id_cookie={stu_id}'}, self.generator.choice(self.missions)
+
+    async def login(self) -> httpx.Response:
+        """Log in as a random student."""
+        stu_id = self.generator.choice(self.students)
+        return await self.client.get('/', params={'stu_id': stu_id})
+
+    async def list(self) -> httpx.Response:
+        """View the missions page."""
+        headers, _ = self.pick()
+        return await self.client.get('/submit', headers=headers)
+
+    async def detail(self) -> httpx.Response:
+        """View the submit page of a mission."""
+        headers, mission_url = self.pick()
+        return await self.client.get(f'/submit/{mission_url}', headers=headers)
+
+    async def upload(self) -> httpx.Response:
+        """Upload a zip to a mission."""
+        headers, mission_url = self.pick()
+        payload = self.generator.choice(self.payloads)
+        return await self.client.post(f'/submit/{mission_url}', headers=headers,
+                                      files={'file': ('homework.zip', payload,
+                                                      'application/zip')})
+
+    async def lock(self) -> httpx.Response:
+        """Lock the uploaded file of a mission."""
+        headers, mission_url = self.pick()
+        return await self.client.get(f'/lock/{mission_url}', headers=headers)
+
+    async def rush(self) -> httpx.Response:
+        """Send a request picked by RUSH_MIX."""
+        scenario = self.generator.choices(list(RUSH_MIX), weights=list(RUSH_MIX.values()))[0]
+        return await getattr(self, scenario)()
+
+
+async def run_scenario(request: Callable[[], Awaitable[httpx.Response]],
+                       count: int, concurrency: int, pid: int) -> dict:
+    """
+    Send count requests, concurrency of them at a time.
+
+    Args:
+        request: function sending a request
+        count: count of requests
+        concurrency: count of requests at the same time
+        pid: id of the server process
+
+    Returns:
+        dict: the results
+    """
+    latencies = []
+    errors = 0
+    remaining = iter(range(count))
+
+    async def client() -> None:
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await request()
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    with ResourceSampler(pid) as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'requests': count,
+            'errors': errors,
+            'p50_ms': round(1000 * percentile(latencies, 0.50), 2),
+            'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+            'p99_ms': round(1000 * percentile(latencies, 0.99), 2),
+            'throughput_rps': round(count / elapsed, 1),
+            'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1),
+            'peak_fds': sampler.peak_fds}
+
+
+def free_port() -> int:
+    """
+    Find a free local port.
+
+    Args:
+        None
+
+    Returns:
+        int: the port
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(workspace: Path) -> tuple:
+    """
+    Start the app under uvicorn in the workspace.
+
+    Args:
+        workspace: directory of the workspace
+
+    Returns:
+        tuple: the server process and its url
+    """
+    port = free_port()
+    code = ('import logging; logging.disable(logging.INFO); import uvicorn; '
+            f'uvicorn.run("main:app", host="127.0.0.1", port={port}, log_level="warning")')
+    env = dict(os.environ, PYTHONPATH=str(APP_PATH))
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=workspace, env=env)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        try:
+            httpx.get(f'{url}/metrics', timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+def load_app(workspace: Path):
+    """
+    Import the app in this process, with the workspace as its root.
+
+    Args:
+        workspace: directory of the workspace
+
+    Returns:
+        the ASGI app
+    """
+    os.chdir(workspace)
+    sys.path.insert(0, str(APP_PATH))
+    logging.disable(logging.INFO)
+    import main  # pylint: disable=import-outside-toplevel,import-error
+    return main.app
+
+
+async def run_all(args: argparse.Namespace, workspace: Path, data: dict) -> Dict[str, dict]:
+    """
+    Run every scenario against the app.
+
+    Args:
+        args: command line arguments
+        workspace: directory of the workspace
+        data: student ids and urls of the open missions
+
+    Returns:
+        Dict[str, dict]: results keyed by scenario
+    """
+    process = None
+    if args.mode == 'uvicorn':
+        process, url = start_uvicorn(workspace)
+        transport, pid = httpx.AsyncHTTPTransport(), process.pid
+    else:
+        url = 'http://bench'
+        transport, pid = httpx.ASGITransport(app=load_app(workspace)), os.getpid()
+    sizes = [int(size) * 1024 for size in args.upload_kb.split(',')]
+
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, transport=transport, limits=limits,
+                                     timeout=120, follow_redirects=False) as client:
+            workload = Workload(client, data, sizes)
+            for scenario in args.scenarios.split(','):
+                count = args.requests if scenario != 'rush' else 5 * args.requests
+                results[scenario] = await run_scenario(getattr(workload, scenario), count,
+                                                       args.concurrency, pid)
+                print(f'{scenario:<8}', ' '.join(f'{key}={value}' for key, value in
+                                                 results[scenario].items()), flush=True)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> bool:
+    """
+    Compare results with the baseline.
+
+    Args:
+        results: results keyed by scenario
+        baseline: the saved baseline
+        tolerance: fraction p95 latency may grow by
+
+    Returns:
+        bool: if no scenario regressed
+    """
+    passed = True
+    for scenario, result in results.items():
+        previous = baseline.get('results', {}).get(scenario)
+        if not previous:
+            continue
+        ratio = result['p95_ms'] / max(previous['p95_ms'], 0.01)
+        regressed = ratio > 1 + tolerance
+        passed = passed and not regressed
+        print(f'{scenario:<8} p95 {previous["p95_ms"]}ms -> {result["p95_ms"]}ms '
+              f'({ratio:.2f}x){" REGRESSED" if regressed else ""}')
+    return passed
+
+
+def main() -> None:
+    """
+    Run the benchmark from the command line.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['inproc', 'uvicorn'], default='inproc')
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--missions', type=int, default=8)
+    parser.add_argument('--submitted', type=float, default=0.5,
+                        help='fraction of students having submitted each mission')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests of each scenario, five times for rush')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--upload-kb', default='256,1024,4096',
+                        help='sizes of uploaded zips, in KiB')
+    parser.add_argument('--scenarios', default='login,list,detail,upload,lock,rush')
+    parser.add_argument('--baseline', type=Path, default=BENCH_PATH / 'baseline.json')
+    parser.add_argument('--save', action='store_true', help='save results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction p95 latency may grow by before failing')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='collector-bench-') as directory:
+        workspace = Path(directory)
+        data = make_workspace(workspace, args.students, args.missions, args.submitted)
+        results = asyncio.run(run_all(args, workspace, data))
+
+    report = {'environment': {'python': platform.python_version(),
+                              'machine': platform.machine(),
+                              'cpus': os.cpu_count(),
+                              'mode': args.mode,
+                              'students': args.students,
+                              'missions': args.missions,
+                              'concurrency': args.concurrency},
+              'results': results}
+    if args.save:
+        args.baseline.write_text(json.dumps(report, indent=2) + '\n', encoding='UTF-8')
+        print(f'baseline saved to {args.baseline}')
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding='UTF-8'))
+        if baseline.get('environment') != report['environment']:
+            print('baseline was taken in another environment, comparing anyway')
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Measure CPU time and allocations per request of the submit_list handler,
+called directly without the HTTP stack.
+
+Usage:
+    python bench/submit_list.py [--students 500] [--missions 20] [--requests 2000]
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import inspect
+import tempfile
+import time
+import tracemalloc
+
+from starlette.requests import Request
+
+from bench import load_app, make_workspace
+
+
+def make_request(stu_id: str, etag: str = '') -> Request:
+    """
+    Make a request of the missions page.
+
+    Args:
+        stu_id: student id
+        etag: ETag sent in If-None-Match
+
+    Returns:
+        Request: the request
+    """
+    headers = [(b'cookie', f'stu_id_cookie={stu_id}'.encode())]
+    if etag:
+        headers.append((b'if-none-match', etag.encode()))
+    return Request({'type': 'http', 'method': 'GET', 'path': '/submit',
+                    'query_string': b'', 'headers': headers})
+
+
+async def measure(main, students: list, requests: int, revalidate: bool) -> dict:
+    """
+    Call submit_list for students in turn.
+
+    Args:
+        main: the app module
+        students: student ids
+        requests: count of calls
+        revalidate: send the ETag of the last response, so the page is not rendered
+
+    Returns:
+        dict: the results
+    """
+    etags = {}
+
+    async def call(stu_id: str):
+        response = main.submit_list(make_request(stu_id, etags.get(stu_id, '')),
+                                    stu_id=stu_id, invalid=None)
+        if inspect.isawaitable(response):
+            response = await response
+        if revalidate:
+            etags[stu_id] = response.headers['etag']
+        return response
+
+    for stu_id in students:
+        await call(stu_id)
+
+    start_cpu = time.process_time()
+    for index in range(requests):
+        await call(students[index % len(students)])
+    cpu = time.process_time() - start_cpu
+
+    # memory traced apart, tracing slows down the calls
+    tracemalloc.start()
+    transient = 0
+    samples = min(requests, 200)
+    for index in range(samples):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await call(students[index % len(students)])
+        transient += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return {'cpu_us_per_request': round(1e6 * cpu / requests, 1),
+            'peak_kib_per_request': round(transient / samples / 1024, 1)}
+
+
+def main() -> None:
+    """
+    Run the benchmark from the command line.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--missions', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='collector-bench-') as directory:
+        workspace = Path(directory)
+        data = make_workspace(workspace, args.students, args.missions, 0.5)
+        load_app(workspace)
+        import main as app_main  # pylint: disable=import-outside-toplevel,import-error
+        students = data['students'][:50]
+        for revalidate in [False, True]:
+            result = asyncio.run(measure(app_main, students, args.requests, revalidate))
+            print('304' if revalidate else '200',
+                  ' '.join(f'{key}={value}' for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
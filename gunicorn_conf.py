@@ -1,3 +1,4 @@
+import gc
 import json
 import multiprocessing
 import os
@@ -35,6 +36,7 @@ use_errorlog = errorlog_var or None
 graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
 timeout_str = os.getenv("TIMEOUT", "120")
 keepalive_str = os.getenv("KEEP_ALIVE", "5")
+shared_state_str = os.getenv("SHARED_STATE", None)
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -46,6 +48,17 @@ accesslog = use_accesslog
 graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
+# Load the app (and its store) once in the master, workers share it copy-on-write
+preload_app = shared_state_str == "1"
+
+
+def when_ready(server):
+    """
+    Called in the master just before the workers are forked.
+    """
+    if preload_app:
+        # keep the preloaded objects out of gc, so workers don't copy their pages
+        gc.freeze()
 
 
 # For debugging and testing
@@ -56,6 +69,7 @@ log_data = {
     "graceful_timeout": graceful_timeout,
     "timeout": timeout,
     "keepalive": keepalive,
+    "preload_app": preload_app,
     "errorlog": errorlog,
     "accesslog": accesslog,
     # Additional, non-gunicorn variables